@@ -1,19 +1,106 @@
 from bcrypt import checkpw, hashpw, gensalt
-from psycopg2.extras import RealDictCursor
-from flask import Flask, request, jsonify, send_from_directory
+from psycopg2.extras import RealDictCursor, Json
+from flask import Flask, Request, request, jsonify, send_from_directory, stream_with_context, g, has_request_context
+from werkzeug.exceptions import NotFound, RequestedRangeNotSatisfiable, RequestEntityTooLarge
+from flask.json.provider import DefaultJSONProvider
 from flasgger import Swagger
 from flask_cors import CORS
 from functools import wraps
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from urllib.parse import quote
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
 import psycopg2
+import base64
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import re
+import sqlite3
+import struct
+import tempfile
+import sys
+import threading
+import time
 import jwt
 import os
+import random
 import uuid
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from PIL import ExifTags, Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+HTTP_DATE_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+HTTP_DATE_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# Same HTTP date as werkzeug's http_date (naive datetimes are UTC), several times faster; anything
+# other than a datetime goes to the default provider's hook
+def orjson_default(o):
+    if isinstance(o, datetime):
+        if o.tzinfo is not None:
+            o = o.astimezone(timezone.utc)
+        return (
+            f"{HTTP_DATE_WEEKDAYS[o.weekday()]}, {o.day:02d} {HTTP_DATE_MONTHS[o.month - 1]} {o.year:04d} "
+            f"{o.hour:02d}:{o.minute:02d}:{o.second:02d} GMT"
+        )
+    return DefaultJSONProvider.default(o)
+
+# Flask JSON provider that serializes with orjson, producing the same output as the default provider:
+# sorted keys, HTTP dates for datetimes and indentation in debug mode
+class OrjsonProvider(DefaultJSONProvider):
+    default = staticmethod(orjson_default)
+
+    def _options(self, indent=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)  # Options orjson does not support, such as cls or separators
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+# JSON serializer for responses: orjson when installed (the default), or stdlib
+JSON_PROVIDER = os.getenv('PLAYGRADE_JSON_PROVIDER', 'orjson')
 
 app = Flask(__name__)
+if JSON_PROVIDER == 'orjson' and orjson is not None:
+    app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = os.getenv('PLAYGRADE_SECRET_KEY', 'default_secret_key')
 app.config['UPLOAD_FOLDER'] = './uploads'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-CORS(app)
+CORS(app, expose_headers=['X-Playgrade-Last-Write'])
 
 swagger = Swagger(app, template={
     "swagger": "2.0",
@@ -42,9 +129,1301 @@ PLAYGRADE_DB_CONFIG = {
     'host': os.getenv('PLAYGRADE_DB_HOST')
 }
 
-# Connect to the database
-def get_db_connection():
-    return psycopg2.connect(**PLAYGRADE_DB_CONFIG)
+# Connection pool sizing, applied per gunicorn worker process
+PLAYGRADE_DB_POOL_CONFIG = {
+    'minconn': int(os.getenv('PLAYGRADE_DB_POOL_MIN', 1)),
+    'maxconn': int(os.getenv('PLAYGRADE_DB_POOL_MAX', 10)),
+    'timeout': float(os.getenv('PLAYGRADE_DB_POOL_TIMEOUT', 5)),
+    'max_uses': int(os.getenv('PLAYGRADE_DB_POOL_MAX_USES', 1000)),
+    'max_idle': float(os.getenv('PLAYGRADE_DB_POOL_MAX_IDLE', 300)),
+    'ping_after': float(os.getenv('PLAYGRADE_DB_POOL_PING_AFTER', 30))
+}
+
+# Raised when no pooled connection frees up within the checkout timeout
+class PoolTimeout(Exception):
+    pass
+
+# Connection that remembers which named prepared statements exist in its server session
+class PooledConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+# Thread-safe pool of database connections
+class ConnectionPool:
+    def __init__(self, db_config, minconn, maxconn, timeout, max_uses, max_idle, ping_after):
+        self.db_config = db_config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._inherited = []
+        self._reset()
+
+    def _reset(self):
+        # Connections opened before a fork belong to the parent; keep them referenced so they are never closed here
+        self._inherited.extend(conn for conn, _ in getattr(self, '_idle', []))
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at) pairs, most recently returned last
+        self._uses = {}
+        self._opened = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._counters = {'checkouts': 0, 'timeouts': 0, 'discarded': 0, 'recycled': 0}
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+
+    def _connect(self):
+        conn = psycopg2.connect(connection_factory=PooledConnection, **self.db_config)
+        self._uses[id(conn)] = 0
+        return conn
+
+    def _close(self, conn):
+        self._uses.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # Reject connections the server has dropped since they were last used
+    def _is_usable(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            with self._cond:
+                if self._pid != os.getpid():
+                    self._reset()
+                self._waiting += 1
+                try:
+                    while not self._idle and self._opened >= self.maxconn:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters['timeouts'] += 1
+                            raise PoolTimeout(f"Timed out after {self.timeout}s waiting for a database connection")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                conn, returned_at = self._idle.pop() if self._idle else (None, None)
+                if conn is None:
+                    self._opened += 1
+                self._in_use += 1
+
+            if conn is not None and not self._is_usable(conn, returned_at):
+                self.putconn(conn, broken=True)
+                continue
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._opened -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+
+            elapsed = time.monotonic() - start
+            with self._cond:
+                self._uses[id(conn)] = self._uses.get(id(conn), 0) + 1
+                self._counters['checkouts'] += 1
+                self._checkout_time_total += elapsed
+                self._checkout_time_max = max(self._checkout_time_max, elapsed)
+            return conn
+
+    def putconn(self, conn, broken=False):
+        if self._pid != os.getpid():
+            return
+
+        discard = broken or conn.closed
+        if not discard and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Never hand the next request a connection with an open or failed transaction
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._counters['discarded'] += 1
+            elif self._uses.get(id(conn), 0) >= self.max_uses:
+                self._counters['recycled'] += 1
+                discard = True
+
+            if discard:
+                self._opened -= 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+
+            # Trim connections that sat idle too long, down to the configured minimum
+            now = time.monotonic()
+            while len(self._idle) > self.minconn and now - self._idle[0][1] > self.max_idle:
+                stale, _ = self._idle.pop(0)
+                self._opened -= 1
+                self._close(stale)
+
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            checkouts = self._counters['checkouts']
+            return {
+                "pid": self._pid,
+                "min": self.minconn,
+                "max": self.maxconn,
+                "opened": self._opened,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                **self._counters,
+                "checkout_latency_ms": {
+                    "avg": round(self._checkout_time_total / checkouts * 1000, 3) if checkouts else 0.0,
+                    "max": round(self._checkout_time_max * 1000, 3)
+                }
+            }
+
+db_pool = ConnectionPool(PLAYGRADE_DB_CONFIG, **PLAYGRADE_DB_POOL_CONFIG)
+
+# Read replica used by handlers marked @replica_read; unset PLAYGRADE_REPLICA_DB_HOST keeps every read on the primary.
+# Replica sessions are read-only so a misrouted write fails instead of diverging.
+PLAYGRADE_REPLICA_DB_CONFIG = {
+    'dbname': os.getenv('PLAYGRADE_REPLICA_DB_NAME', PLAYGRADE_DB_CONFIG['dbname']),
+    'user': os.getenv('PLAYGRADE_REPLICA_DB_USER', PLAYGRADE_DB_CONFIG['user']),
+    'password': os.getenv('PLAYGRADE_REPLICA_DB_PASSWORD', PLAYGRADE_DB_CONFIG['password']),
+    'host': os.getenv('PLAYGRADE_REPLICA_DB_HOST'),
+    'options': '-c default_transaction_read_only=on'
+}
+replica_pool = ConnectionPool(PLAYGRADE_REPLICA_DB_CONFIG, **PLAYGRADE_DB_POOL_CONFIG) if PLAYGRADE_REPLICA_DB_CONFIG['host'] else None
+
+# Seconds after a user's write during which their reads stay on the primary
+REPLICA_READ_YOUR_WRITES_WINDOW = float(os.getenv('PLAYGRADE_REPLICA_RYW_WINDOW', 5))
+
+# Pick the pool for the current request: the replica for @replica_read handlers, unless the caller wrote recently
+def select_pool():
+    if replica_pool is None or not has_request_context() or not g.get('replica_read'):
+        return db_pool
+    if time.time() - last_write_time() < REPLICA_READ_YOUR_WRITES_WINDOW:
+        return db_pool
+    return replica_pool
+
+# Check out a pooled database connection for the duration of a with-block; primary=True skips the replica
+@contextmanager
+def get_db_connection(primary=False):
+    pool = db_pool if primary else select_pool()
+    try:
+        conn = pool.getconn()
+    except (PoolTimeout, psycopg2.OperationalError):
+        if pool is db_pool:
+            raise
+        pool = db_pool  # Replica unreachable or saturated; the primary can always serve the read
+        conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except psycopg2.errors.QueryCanceled:
+        raise  # Statement timeouts leave the connection usable
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, broken=broken)
+
+# Server-side prepared statements for hot queries: on/off, and how many each connection may hold
+PREPARED_STATEMENT_CONFIG = {
+    'enabled': os.getenv('PLAYGRADE_PREPARED_STATEMENTS', '1') == '1',
+    'max_per_connection': int(os.getenv('PLAYGRADE_PREPARED_STATEMENTS_MAX', 256))
+}
+prepared_statement_counters = {'prepared': 0, 'executed': 0, 'ad_hoc': 0, 'fallbacks': 0}
+
+# Rewrite psycopg2 %s placeholders as $1, $2, ... for PREPARE
+def to_positional_sql(sql):
+    numbers = itertools.count(1)
+    return re.sub(r'%s|%%', lambda match: f"${next(numbers)}" if match.group() == '%s' else '%', sql)
+
+# Execute a query through a named prepared statement on this connection, preparing it on first use.
+# Each distinct SQL text (e.g. each filter combination of get_posts) gets its own statement, so later
+# requests only send parameters. If the session lost its statements (for example a server-side reset),
+# the registry is rebuilt and the query runs as plain SQL.
+def execute_prepared(cur, sql, params=()):
+    conn = cur.connection
+    prepared = getattr(conn, 'prepared', None)
+    name = "ps_" + hashlib.sha1(sql.encode('utf-8')).hexdigest()[:24]
+    if (
+        not PREPARED_STATEMENT_CONFIG['enabled'] or prepared is None
+        or (name not in prepared and len(prepared) >= PREPARED_STATEMENT_CONFIG['max_per_connection'])
+    ):
+        prepared_statement_counters['ad_hoc'] += 1
+        cur.execute(sql, params)
+        return
+
+    fresh_transaction = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} AS {to_positional_sql(sql)}")
+            prepared.add(name)
+            prepared_statement_counters['prepared'] += 1
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+        prepared_statement_counters['executed'] += 1
+    except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.DuplicatePreparedStatement):
+        # The session's statements no longer match the registry; only retry when nothing else ran in this transaction
+        prepared.clear()
+        if not fresh_transaction:
+            raise
+        conn.rollback()
+        cur.execute("DEALLOCATE ALL")
+        prepared_statement_counters['fallbacks'] += 1
+        cur.execute(sql, params)
+
+# Thread-safe LRU cache with optional per-entry expiry and an optional memory budget
+class LRUCache:
+    def __init__(self, max_entries, ttl=None, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda key, value: 0)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size), least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            self._remove(key)
+            entry = None
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = self.sizeof(key, value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # Too large to ever fit
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    # Change a cached value in place under the cache lock; does nothing when the key is not cached
+    def mutate(self, key, update):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                return
+            update(entry[0])
+            size = self.sizeof(key, entry[0])
+            self._entries[key] = (entry[0], entry[1], size)
+            self._bytes += size - entry[2]
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if predicate(key, entry[0])]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            stats = {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+            if self.max_bytes is not None:
+                stats.update({"bytes": self._bytes, "max_bytes": self.max_bytes})
+            return stats
+
+# Title autocomplete settings and its per-prefix result cache
+SUGGEST_CONFIG = {
+    'limit': int(os.getenv('PLAYGRADE_SUGGEST_LIMIT', 8)),
+    'max_limit': 20,
+    'min_length': 3,  # Trigram index lookups need at least one full trigram
+    'timeout_ms': int(os.getenv('PLAYGRADE_SUGGEST_TIMEOUT_MS', 150)),
+    'cache_size': int(os.getenv('PLAYGRADE_SUGGEST_CACHE_SIZE', 4096)),
+    'cache_ttl': float(os.getenv('PLAYGRADE_SUGGEST_CACHE_TTL', 60))
+}
+suggest_cache = LRUCache(SUGGEST_CONFIG['cache_size'], ttl=SUGGEST_CONFIG['cache_ttl'])
+
+# pg_trgm trigrams of a string: each alphanumeric word, lowercased and padded with two spaces before and one after
+def trigrams(text):
+    grams = set()
+    for word in re.findall(r'[^\W_]+', text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+# pg_trgm similarity(): shared trigrams over all distinct trigrams of both strings
+def trigram_similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+# Feed page cache for GET /posts, with a lifetime per sort order. Invalidation only reaches the current worker,
+# so the TTLs bound how stale other workers' pages can get.
+FEED_CACHE_TTLS = {
+    "Newest": float(os.getenv('PLAYGRADE_FEED_CACHE_TTL_NEWEST', 5)),
+    "Most Liked": float(os.getenv('PLAYGRADE_FEED_CACHE_TTL_MOST_LIKED', 30)),
+    "Most Comments": float(os.getenv('PLAYGRADE_FEED_CACHE_TTL_MOST_COMMENTS', 30)),
+    "Relevance": float(os.getenv('PLAYGRADE_FEED_CACHE_TTL_RELEVANCE', 60))
+}
+feed_cache = LRUCache(int(os.getenv('PLAYGRADE_FEED_CACHE_SIZE', 1024)))
+
+# Drop cached feed pages for the given sort orders, or every page when none are given
+def invalidate_feed_cache(*sort_orders):
+    if not sort_orders:
+        feed_cache.clear()
+    else:
+        feed_cache.discard_where(lambda key, page: key[0] in sort_orders)
+
+# Drop cached feed pages, in every sort order, that show one of the given posts; the pages of the given sort orders
+# go too, since a changed counter can move a post onto a page it was not on
+def invalidate_feed_posts(post_ids, *sort_orders):
+    post_ids = set(post_ids)
+    if post_ids:
+        feed_cache.discard_where(
+            lambda key, page: key[0] in sort_orders or any(post['post_id'] in post_ids for post in page['posts'])
+        )
+
+# Per-user (liked post IDs, liked reply IDs) sets, bounded by entry count and approximate memory use
+LIKED_CACHE_CONFIG = {
+    'max_users': int(os.getenv('PLAYGRADE_LIKED_CACHE_USERS', 10000)),
+    'max_bytes': int(os.getenv('PLAYGRADE_LIKED_CACHE_BYTES', 64 * 1024 * 1024)),
+    'max_ids': int(os.getenv('PLAYGRADE_LIKED_CACHE_MAX_IDS', 50000)),
+    'ttl': float(os.getenv('PLAYGRADE_LIKED_CACHE_TTL', 5))
+}
+TOO_MANY_LIKES = "too-many-likes"  # Cached for users whose likes are looked up per page instead
+
+# Approximate bytes held by one liked-set entry: the set objects, the ints inside them and the key
+def liked_entry_size(user_id, liked):
+    if liked == TOO_MANY_LIKES:
+        return 64
+    return sys.getsizeof(liked) + sum(sys.getsizeof(ids) + 32 * len(ids) for ids in liked) + 32
+
+liked_cache = LRUCache(
+    LIKED_CACHE_CONFIG['max_users'],
+    ttl=LIKED_CACHE_CONFIG['ttl'],
+    max_bytes=LIKED_CACHE_CONFIG['max_bytes'],
+    sizeof=liked_entry_size
+)
+
+# Like writes seen per user, striped by user ID. A liked set loaded while a write for the same stripe landed may
+# predate that write, so it is not cached; the lock keeps the check and the store atomic with record_like.
+LIKED_VERSION_STRIPES = 1024
+liked_versions = [0] * LIKED_VERSION_STRIPES
+liked_version_lock = threading.Lock()
+
+# Return the user's cached (post IDs, reply IDs) liked sets, loading them on first use
+def get_liked_ids(conn, user_id):
+    liked = liked_cache.get(user_id)
+    if liked is None:
+        stripe = user_id % LIKED_VERSION_STRIPES
+        version = liked_versions[stripe]
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT post_id, reply_id FROM likes WHERE user_id = %s LIMIT %s",
+                (user_id, LIKED_CACHE_CONFIG['max_ids'] + 1)
+            )
+            rows = cur.fetchall()
+        if len(rows) > LIKED_CACHE_CONFIG['max_ids']:
+            liked = TOO_MANY_LIKES
+        else:
+            liked = ({post_id for post_id, _ in rows if post_id is not None}, {reply_id for _, reply_id in rows if reply_id is not None})
+        with liked_version_lock:
+            if liked_versions[stripe] == version:
+                liked_cache.set(user_id, liked)
+    return liked
+
+# Keep a cached liked set in step with a like or unlike
+def record_like(user_id, target_type, target_id, liked):
+    def update(sets):
+        if sets == TOO_MANY_LIKES:
+            return
+        ids = sets[0] if target_type == 'post' else sets[1]
+        if liked:
+            ids.add(target_id)
+        else:
+            ids.discard(target_id)
+    with liked_version_lock:
+        liked_versions[user_id % LIKED_VERSION_STRIPES] += 1
+        liked_cache.mutate(user_id, update)
+
+# Set the liked flag on each row the user has liked
+def overlay_liked(conn, user_id, rows, target_type):
+    if not rows:
+        return
+    column = 'post_id' if target_type == 'post' else 'reply_id'
+    liked = get_liked_ids(conn, user_id)
+    if liked == TOO_MANY_LIKES:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT {column} FROM likes WHERE user_id = %s AND {column} = ANY(%s)",
+                (user_id, [row[column] for row in rows])
+            )
+            liked_ids = {row[0] for row in cur.fetchall()}
+    else:
+        liked_ids = liked[0] if target_type == 'post' else liked[1]
+    for row in rows:
+        row['liked'] = row[column] in liked_ids
+
+# Post like counters: shards per post (0 updates posts.like_count directly) and how often shards are folded in
+LIKE_COUNTER_CONFIG = {
+    'shards': int(os.getenv('PLAYGRADE_LIKE_SHARDS', 8)),
+    'fold_interval': float(os.getenv('PLAYGRADE_LIKE_FOLD_INTERVAL', 1.0))
+}
+
+# Arbitrary key for the advisory lock that lets one worker at a time fold like shards
+LIKE_FOLD_LOCK_KEY = 7352
+
+# Move every pending shard delta into posts.like_count
+LIKE_FOLD_QUERY = """
+    WITH folded AS (
+        DELETE FROM post_like_shards
+        RETURNING post_id, delta
+    ),
+    totals AS (
+        SELECT post_id, SUM(delta) AS delta FROM folded GROUP BY post_id
+    )
+    UPDATE posts
+    SET like_count = GREATEST(posts.like_count + totals.delta, 0)
+    FROM totals
+    WHERE posts.post_id = totals.post_id AND totals.delta <> 0
+    RETURNING posts.post_id
+"""
+
+# CTE body that applies a +1/-1 like to the targets selected by {source}, plus its parameters.
+# Post likes go to a random shard row so a viral post's likers do not queue on the posts row lock.
+def like_counter_update(target_type, source, delta):
+    column = 'post_id' if target_type == 'post' else 'reply_id'
+    table = 'posts' if target_type == 'post' else 'replies'
+    if target_type == 'post' and LIKE_COUNTER_CONFIG['shards'] > 0:
+        return (
+            f"""
+            INSERT INTO post_like_shards (post_id, shard, delta)
+            SELECT post_id, %s, {delta} FROM {source}
+            ON CONFLICT (post_id, shard) DO UPDATE SET delta = post_like_shards.delta + EXCLUDED.delta
+            """,
+            (random.randrange(LIKE_COUNTER_CONFIG['shards']),)
+        )
+    return (
+        f"""
+        UPDATE {table} SET like_count = GREATEST(like_count + {delta}, 0)
+        WHERE {column} IN (SELECT {column} FROM {source})
+        """,
+        ()
+    )
+
+# Background thread that periodically folds post_like_shards into posts.like_count
+class LikeCounterFolder:
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+
+    # Start the thread on first use in each process, so forked workers get their own
+    def ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name='like-counter-folder', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.fold()
+            except Exception:
+                app.logger.exception("Folding like counter shards failed")
+
+    # Fold pending deltas unless another worker is already doing so; returns the number of posts updated
+    def fold(self):
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (LIKE_FOLD_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                return 0
+            cur.execute(LIKE_FOLD_QUERY)
+            post_ids = [row[0] for row in cur.fetchall()]
+            conn.commit()
+        invalidate_feed_posts(post_ids, "Most Liked")
+        return len(post_ids)
+
+like_counter_folder = LikeCounterFolder(LIKE_COUNTER_CONFIG['fold_interval'])
+
+# Opt-in group commit for likes: a path enables the local journal, which is flushed to Postgres in batches
+LIKE_QUEUE_CONFIG = {
+    'path': os.getenv('PLAYGRADE_LIKE_QUEUE_PATH', ''),
+    'batch_size': int(os.getenv('PLAYGRADE_LIKE_QUEUE_BATCH', 500)),
+    'interval': float(os.getenv('PLAYGRADE_LIKE_QUEUE_INTERVAL', 0.2)),
+    'history': int(os.getenv('PLAYGRADE_LIKE_QUEUE_HISTORY', 50))
+}
+
+# Arbitrary key for the advisory lock that keeps queue flushes in journal order
+LIKE_QUEUE_LOCK_KEY = 7353
+
+# Apply a batch of collapsed like changes for one target type: multi-row insert/delete plus one counter update per target
+LIKE_QUEUE_APPLY_QUERY = """
+    WITH wanted (user_id, {column}) AS (
+        SELECT * FROM unnest(%s::int[], %s::int[])
+    ),
+    unwanted (user_id, {column}) AS (
+        SELECT * FROM unnest(%s::int[], %s::int[])
+    ),
+    added AS (
+        INSERT INTO likes (user_id, {column})
+        SELECT wanted.user_id, wanted.{column}
+        FROM wanted
+        WHERE EXISTS (SELECT 1 FROM {table} WHERE {table}.{column} = wanted.{column})
+        ON CONFLICT DO NOTHING
+        RETURNING {column}
+    ),
+    removed AS (
+        DELETE FROM likes
+        USING unwanted
+        WHERE likes.user_id = unwanted.user_id AND likes.{column} = unwanted.{column}
+        RETURNING likes.{column}
+    ),
+    deltas AS (
+        SELECT {column}, SUM(delta) AS delta
+        FROM (
+            SELECT {column}, 1 AS delta FROM added
+            UNION ALL
+            SELECT {column}, -1 AS delta FROM removed
+        ) AS changes
+        GROUP BY {column}
+    ),
+    counted AS (
+        UPDATE {table}
+        SET like_count = GREATEST({table}.like_count + deltas.delta, 0)
+        FROM deltas
+        WHERE {table}.{column} = deltas.{column} AND deltas.delta <> 0
+    )
+    SELECT (SELECT COUNT(*) FROM added) AS added, (SELECT COUNT(*) FROM removed) AS removed
+"""
+
+# Durable local journal of acknowledged likes/unlikes, flushed to Postgres by a background thread.
+# Entries are deleted only after their batch commits, so anything left after a crash is replayed on startup;
+# replaying is safe because a batch only ever moves each (user, target) to its latest journaled state.
+class LikeQueue:
+    def __init__(self, path, batch_size, interval, history):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._batches = deque(maxlen=history)
+        self.flushed_entries = 0
+        self.flush_errors = 0
+        self.replayed_entries = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    # One SQLite connection per thread and process; WAL with synchronous=FULL so an acknowledged like survives a crash
+    def _journal(self):
+        journal = getattr(self._local, 'journal', None)
+        if journal is None or self._local.pid != os.getpid():
+            journal = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            journal.execute("PRAGMA journal_mode=WAL")
+            journal.execute("PRAGMA synchronous=FULL")
+            journal.execute("""
+                CREATE TABLE IF NOT EXISTS like_queue (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    target_type TEXT NOT NULL,
+                    target_id INTEGER NOT NULL,
+                    liked INTEGER NOT NULL,
+                    queued_at REAL NOT NULL
+                )
+            """)
+            journal.execute("CREATE INDEX IF NOT EXISTS like_queue_key_idx ON like_queue (user_id, target_type, target_id)")
+            self._local.journal = journal
+            self._local.pid = os.getpid()
+        return journal
+
+    # Start the flusher on first use in each process, replaying whatever a previous process left behind
+    def ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self.replayed_entries = self.depth()
+                threading.Thread(target=self._run, name='like-queue-flusher', daemon=True).start()
+                self._pid = os.getpid()
+
+    def enqueue(self, user_id, target_type, target_id, liked):
+        self.ensure_running()
+        self._journal().execute(
+            "INSERT INTO like_queue (user_id, target_type, target_id, liked, queued_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, target_type, int(target_id), int(liked), time.time())
+        )
+
+    # Latest journaled state for a (user, target), or None when nothing is waiting to be flushed
+    def pending_state(self, user_id, target_type, target_id):
+        row = self._journal().execute(
+            "SELECT liked FROM like_queue WHERE user_id = ? AND target_type = ? AND target_id = ? ORDER BY seq DESC LIMIT 1",
+            (user_id, target_type, target_id)
+        ).fetchone()
+        return None if row is None else bool(row[0])
+
+    def depth(self):
+        return self._journal().execute("SELECT COUNT(*) FROM like_queue").fetchone()[0]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                while self.flush() == self.batch_size:
+                    pass  # Keep draining while batches come back full
+            except Exception:
+                self.flush_errors += 1
+                app.logger.exception("Flushing the like queue failed")
+
+    # Apply the oldest batch_size entries to Postgres; returns how many journal entries were consumed
+    def flush(self):
+        started = time.perf_counter()
+        journal = self._journal()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (LIKE_QUEUE_LOCK_KEY,))
+            if not cur.fetchone()['locked']:
+                return 0
+
+            # Read under the lock, so no other flusher can apply an older state over a newer one
+            entries = journal.execute(
+                "SELECT seq, user_id, target_type, target_id, liked, queued_at FROM like_queue ORDER BY seq LIMIT ?",
+                (self.batch_size,)
+            ).fetchall()
+            if not entries:
+                return 0
+
+            # Collapse to the last state per (user, target); later entries win
+            latest = {}
+            for _, user_id, target_type, target_id, liked, _ in entries:
+                latest[(user_id, target_type, target_id)] = bool(liked)
+
+            added = removed = 0
+            for target_type, column, table in (('post', 'post_id', 'posts'), ('reply', 'reply_id', 'replies')):
+                wanted = [(user_id, target_id) for (user_id, kind, target_id), liked in latest.items() if kind == target_type and liked]
+                unwanted = [(user_id, target_id) for (user_id, kind, target_id), liked in latest.items() if kind == target_type and not liked]
+                if not wanted and not unwanted:
+                    continue
+                cur.execute(
+                    LIKE_QUEUE_APPLY_QUERY.format(column=column, table=table),
+                    (
+                        [user_id for user_id, _ in wanted], [target_id for _, target_id in wanted],
+                        [user_id for user_id, _ in unwanted], [target_id for _, target_id in unwanted]
+                    )
+                )
+                result = cur.fetchone()
+                added += result['added']
+                removed += result['removed']
+            conn.commit()
+
+        journal.execute("DELETE FROM like_queue WHERE seq <= ?", (entries[-1][0],))
+        self.flushed_entries += len(entries)
+        self._batches.append({
+            "entries": len(entries),
+            "collapsed": len(latest),
+            "added": added,
+            "removed": removed,
+            "lag_ms": round((time.time() - entries[0][5]) * 1000, 1),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "flushed_at": datetime.utcnow().isoformat()
+        })
+        if added or removed:
+            invalidate_feed_posts([target_id for _, kind, target_id in latest if kind == 'post'], "Most Liked")
+        return len(entries)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "depth": self.depth() if self.enabled else 0,
+            "flushed_entries": self.flushed_entries,
+            "flush_errors": self.flush_errors,
+            "replayed_entries": self.replayed_entries,
+            "recent_batches": list(self._batches)
+        }
+
+like_queue = LikeQueue(LIKE_QUEUE_CONFIG['path'], LIKE_QUEUE_CONFIG['batch_size'], LIKE_QUEUE_CONFIG['interval'], LIKE_QUEUE_CONFIG['history'])
+
+# Largest number of operations or IDs accepted by POST /likes/batch and GET /likes/state
+LIKE_BATCH_LIMIT = int(os.getenv('PLAYGRADE_LIKE_BATCH_LIMIT', 100))
+
+# Largest post_id/reply_id a SERIAL column can hold
+MAX_SERIAL_ID = 2147483647
+
+# Validate a like/unlike against Postgres plus anything still queued, then journal it instead of writing it.
+# Reads through the caller's cursor; returns the response body and status code.
+def queue_like_change(cur, user_id, target_type, target_id, liked):
+    column = 'post_id' if target_type == 'post' else 'reply_id'
+    table = 'posts' if target_type == 'post' else 'replies'
+    cur.execute(
+        f"""
+        SELECT
+            EXISTS (SELECT 1 FROM {table} WHERE {column} = %s) AS found,
+            EXISTS (SELECT 1 FROM likes WHERE user_id = %s AND {column} = %s) AS liked
+        """,
+        (target_id, user_id, target_id)
+    )
+    result = cur.fetchone()
+
+    pending = like_queue.pending_state(user_id, target_type, target_id)
+    currently_liked = result['liked'] if pending is None else pending
+    if liked:
+        if not result['found']:
+            return {"error": f"{target_type.capitalize()} not found"}, 404
+        if currently_liked:
+            return {"error": "Like already exists"}, 400
+    elif not currently_liked:
+        return {"error": "Like does not exist"}, 400
+
+    like_queue.enqueue(user_id, target_type, target_id, liked)
+    record_like(user_id, target_type, target_id, liked)
+    if liked:
+        return {"message": "Like added successfully"}, 201
+    return {"message": "Like removed successfully"}, 200
+
+# Add or remove one like, with its counter update, in a single statement on the caller's transaction.
+# Returns the response body and status code; the caller commits on success.
+def apply_like_change(cur, user_id, target_type, target_id, liked):
+    column = 'post_id' if target_type == 'post' else 'reply_id'
+    table = 'posts' if target_type == 'post' else 'replies'
+
+    if liked:
+        # The unique key makes a duplicate like a no-op
+        counter_update, counter_params = like_counter_update(target_type, 'added', 1)
+        cur.execute(
+            f"""
+            WITH target AS (
+                SELECT {column} FROM {table} WHERE {column} = %s
+            ),
+            added AS (
+                INSERT INTO likes (user_id, {column})
+                SELECT %s, {column} FROM target
+                ON CONFLICT DO NOTHING
+                RETURNING {column}
+            ),
+            counted AS ({counter_update})
+            SELECT
+                EXISTS (SELECT 1 FROM target) AS found,
+                EXISTS (SELECT 1 FROM added) AS added
+            """,
+            (target_id, user_id) + counter_params
+        )
+        result = cur.fetchone()
+        if not result['found']:
+            return {"error": f"{target_type.capitalize()} not found"}, 404
+        if not result['added']:
+            return {"error": "Like already exists"}, 400
+        return {"message": "Like added successfully"}, 201
+
+    counter_update, counter_params = like_counter_update(target_type, 'removed', -1)
+    cur.execute(
+        f"""
+        WITH removed AS (
+            DELETE FROM likes
+            WHERE user_id = %s
+            AND {column} = %s
+            RETURNING {column}
+        ),
+        counted AS ({counter_update})
+        SELECT EXISTS (SELECT 1 FROM removed) AS removed
+        """,
+        (user_id, target_id) + counter_params
+    )
+    if not cur.fetchone()['removed']:
+        return {"error": "Like does not exist"}, 400
+    return {"message": "Like removed successfully"}, 200
+
+# Home timeline settings: posts kept per user, and the follower count above which a poster's posts are read on demand
+TIMELINE_CONFIG = {
+    'length': int(os.getenv('PLAYGRADE_TIMELINE_LENGTH', 500)),
+    'fanout_limit': int(os.getenv('PLAYGRADE_TIMELINE_FANOUT_LIMIT', 5000))
+}
+
+# Cut the timelines of the users selected by {users} back to TIMELINE_CONFIG['length'] entries
+TIMELINE_TRIM_QUERY = """
+    DELETE FROM timeline
+    USING ({users}) AS affected
+    CROSS JOIN LATERAL (
+        SELECT kept.created_at, kept.post_id
+        FROM timeline AS kept
+        WHERE kept.user_id = affected.user_id
+        ORDER BY kept.created_at DESC, kept.post_id DESC
+        OFFSET %s LIMIT 1
+    ) AS cutoff
+    WHERE timeline.user_id = affected.user_id
+      AND (timeline.created_at, timeline.post_id) <= (cutoff.created_at, cutoff.post_id)
+"""
+
+# Push a new post into its poster's followers' timelines, unless the poster has too many followers
+def fan_out_post(cur, post_id):
+    cur.execute(
+        """
+        INSERT INTO timeline (user_id, post_id, poster_id, created_at)
+        SELECT follows.follower_id, posts.post_id, posts.poster_id, posts.created_at
+        FROM posts
+        JOIN users ON posts.poster_id = users.user_id
+        JOIN follows ON follows.followee_id = posts.poster_id
+        WHERE posts.post_id = %s AND users.follower_count <= %s
+        ON CONFLICT DO NOTHING
+        """,
+        (post_id, TIMELINE_CONFIG['fanout_limit'])
+    )
+    if cur.rowcount:
+        users = "SELECT follows.follower_id AS user_id FROM follows JOIN posts ON follows.followee_id = posts.poster_id WHERE posts.post_id = %s"
+        cur.execute(TIMELINE_TRIM_QUERY.format(users=users), (post_id, TIMELINE_CONFIG['length']))
+
+# Copy a followed user's posts into the follower's timeline, or into every follower's when follower_id is None
+# (used when the followee drops back under the fan-out limit, since posts made above it were never fanned out).
+# Only posts at or after each timeline's oldest entry are copied, so a timeline always holds every
+# fanned-out post from that point on and get_posts can fall back to reading follows for older pages.
+def backfill_timeline(cur, follower_id, followee_id):
+    followers = "AND follows.follower_id = %s" if follower_id is not None else ""
+    cur.execute(
+        f"""
+        INSERT INTO timeline (user_id, post_id, poster_id, created_at)
+        SELECT follows.follower_id, recent.post_id, recent.poster_id, recent.created_at
+        FROM follows
+        JOIN users ON follows.followee_id = users.user_id
+        CROSS JOIN LATERAL (
+            SELECT posts.post_id, posts.poster_id, posts.created_at
+            FROM posts
+            WHERE posts.poster_id = follows.followee_id
+              AND (
+                  NOT EXISTS (SELECT 1 FROM timeline WHERE user_id = follows.follower_id)
+                  OR (posts.created_at, posts.post_id) >= (
+                      SELECT created_at, post_id FROM timeline
+                      WHERE user_id = follows.follower_id
+                      ORDER BY created_at, post_id
+                      LIMIT 1
+                  )
+              )
+            ORDER BY posts.created_at DESC, posts.post_id DESC
+            LIMIT %s
+        ) AS recent
+        WHERE follows.followee_id = %s {followers}
+          AND users.follower_count <= %s
+        ON CONFLICT DO NOTHING
+        """,
+        (TIMELINE_CONFIG['length'], followee_id)
+        + ((follower_id,) if follower_id is not None else ())
+        + (TIMELINE_CONFIG['fanout_limit'],)
+    )
+    if cur.rowcount:
+        users = f"SELECT follows.follower_id AS user_id FROM follows WHERE follows.followee_id = %s {followers}"
+        cur.execute(
+            TIMELINE_TRIM_QUERY.format(users=users),
+            (followee_id,) + ((follower_id,) if follower_id is not None else ()) + (TIMELINE_CONFIG['length'],)
+        )
+
+# Split a followed-users Newest feed at the viewer's oldest timeline entry. At and above it the page comes from the
+# timeline plus posts of users too big to fan out; only rows below it need the follows query (followed_candidate),
+# and the timeline query is skipped once the cursor has passed that entry. Returns the candidates in order.
+def timeline_candidates(cur, user_id, query, params, followed_candidate, cursor_values):
+    execute_prepared(
+        cur,
+        "SELECT created_at, post_id FROM timeline WHERE user_id = %s ORDER BY created_at, post_id LIMIT 1",
+        (user_id,)
+    )
+    oldest = cur.fetchone()
+    if oldest is None:
+        return [followed_candidate]
+
+    boundary = [oldest['created_at'], oldest['post_id']]
+    followed_query, followed_params = followed_candidate
+    candidates = [(followed_query + " AND (posts.created_at, posts.post_id) < (%s, %s)", followed_params + boundary)]
+    if cursor_values is None or tuple(cursor_values) > tuple(boundary):
+        timeline_filter = """
+            AND posts.post_id IN (
+                SELECT post_id FROM timeline WHERE user_id = %s
+                UNION ALL
+                SELECT posts.post_id
+                FROM posts
+                JOIN follows ON follows.followee_id = posts.poster_id AND follows.follower_id = %s
+                JOIN users ON posts.poster_id = users.user_id AND users.follower_count > %s
+                WHERE (posts.created_at, posts.post_id) >= (%s, %s)
+            )
+        """
+        candidates.insert(0, (query + timeline_filter, params + [user_id, user_id, TIMELINE_CONFIG['fanout_limit']] + boundary))
+    return candidates
+
+# Turn free-text search input into a prefix-matching tsquery, or None when it has no words
+def build_search_tsquery(search_query):
+    words = re.findall(r'\w+', search_query)
+    return " & ".join(f"{word}:*" for word in words) if words else None
+
+# Whether a tsquery keeps any lexemes once the english dictionary drops stop words ("the:* & a:*" keeps none and
+# would match nothing); answers are cached per query text
+search_term_cache = LRUCache(4096)
+
+def search_tsquery_has_terms(search_terms):
+    has_terms = search_term_cache.get(search_terms)
+    if has_terms is None:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT numnode(to_tsquery('english', %s)) > 0", (search_terms,))
+            has_terms = cur.fetchone()[0]
+        search_term_cache.set(search_terms, has_terms)
+    return has_terms
+
+# Largest total reported exactly by get_posts in capped count mode
+COUNT_CAP = int(os.getenv('PLAYGRADE_COUNT_CAP', 1000))
+
+# Raised when a pagination cursor is malformed or was issued for a different ordering
+class InvalidCursor(ValueError):
+    pass
+
+# Encode the sort key of the last row on a page as an opaque pagination cursor
+def encode_cursor(scope, values):
+    keys = [{"ts": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    payload = json.dumps({"s": scope, "k": keys}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+# Decode a pagination cursor back into its sort key values
+def decode_cursor(cursor, scope, key_count):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if payload.get("s") != scope or len(payload.get("k", [])) != key_count:
+            raise InvalidCursor("Cursor does not match the requested ordering")
+        return [datetime.fromisoformat(k["ts"]) if isinstance(k, dict) else k for k in payload["k"]]
+    except InvalidCursor:
+        raise
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise InvalidCursor("Invalid cursor")
+
+# Reply paging: default and largest page size, the page size above which rows come from a server-side cursor,
+# and how many rows that cursor (or a streamed unpaged thread) fetches per round trip
+REPLIES_CONFIG = {
+    'page_size': int(os.getenv('PLAYGRADE_REPLIES_PAGE_SIZE', 50)),
+    'max_page_size': int(os.getenv('PLAYGRADE_REPLIES_MAX_PAGE_SIZE', 500)),
+    'server_cursor_threshold': int(os.getenv('PLAYGRADE_REPLIES_SERVER_CURSOR_THRESHOLD', 200)),
+    'fetch_size': int(os.getenv('PLAYGRADE_REPLIES_FETCH_SIZE', 100))
+}
+
+# Replies of a post in thread order; {after} continues after a cursor and {limit} bounds the page
+REPLIES_QUERY = """
+    SELECT
+        replies.reply_id,
+        replies.post_id,
+        replies.replier_id,
+        replies.body,
+        replies.image_url,
+        replies.like_count,
+        replies.created_at,
+        users.username,
+        users.profile_picture,
+        FALSE AS liked
+    FROM replies
+    JOIN users ON replies.replier_id = users.user_id
+    WHERE replies.post_id = %s {after}
+    ORDER BY replies.created_at ASC, replies.reply_id ASC
+    {limit}
+"""
+
+# Parse a replies page size, falling back to the default and clamping to the configured maximum
+def parse_replies_limit(value):
+    if value is None:
+        return REPLIES_CONFIG['page_size']
+    return max(1, min(int(value), REPLIES_CONFIG['max_page_size']))
+
+# Fetch one page of a post's replies after an optional cursor; returns (replies, next cursor, has more)
+def fetch_replies_page(conn, user_id, post_id, after, limit):
+    scope = f"replies:{post_id}"
+    after_clause, params = "", [post_id]
+    if after:
+        after_clause = "AND (replies.created_at, replies.reply_id) > (%s, %s)"
+        params.extend(decode_cursor(after, scope, 2))
+    params.append(limit + 1)
+    query = REPLIES_QUERY.format(after=after_clause, limit="LIMIT %s")
+
+    # Large pages are pulled from a named (server-side) cursor in fetch_size batches instead of in one result set
+    if limit > REPLIES_CONFIG['server_cursor_threshold']:
+        with conn.cursor(name=f"replies_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cur:
+            cur.itersize = REPLIES_CONFIG['fetch_size']
+            cur.execute(query, tuple(params))
+            replies = list(cur)
+    else:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            execute_prepared(cur, query, tuple(params))
+            replies = cur.fetchall()
+
+    has_more = len(replies) > limit
+    replies = replies[:limit]
+    next_cursor = encode_cursor(scope, [replies[-1]['created_at'], replies[-1]['reply_id']]) if has_more else None
+    if user_id:
+        overlay_liked(conn, user_id, replies, "reply")
+    return replies, next_cursor, has_more
+
+# Stream a post and all of its replies as one JSON document, reading replies from a server-side cursor
+# in fetch_size batches so a long thread is never held in memory at once
+def stream_post_with_replies(user_id, post):
+    def generate():
+        with get_db_connection() as conn, conn.cursor(name=f"replies_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cur:
+            cur.itersize = REPLIES_CONFIG['fetch_size']
+            cur.execute(REPLIES_QUERY.format(after="", limit=""), (post['post_id'],))
+            yield '{"post":' + app.json.dumps(post) + ',"replies":['
+            separator = ''
+            while True:
+                replies = cur.fetchmany(REPLIES_CONFIG['fetch_size'])
+                if not replies:
+                    break
+                if user_id:
+                    overlay_liked(conn, user_id, replies, "reply")
+                for reply in replies:
+                    yield separator + app.json.dumps(reply)
+                    separator = ','
+            yield ']}'
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+# Build post and reply JSON in Postgres instead of through RealDictCursor dicts and jsonify
+PG_JSON_RESPONSES = os.getenv('PLAYGRADE_PG_JSON', '0') == '1'
+
+# to_char pattern matching the HTTP date format jsonify uses for datetimes (created_at is a UTC TIMESTAMP)
+HTTP_DATE_SQL = """'Dy, DD Mon YYYY HH24:MI:SS "GMT"'"""
+
+# A post as jsonify would render it, keys in sorted order; the one parameter is the viewer's user ID (or NULL)
+POST_JSON_SQL = f"""
+    json_build_object(
+        'body', posts.body,
+        'category', posts.category,
+        'created_at', to_char(posts.created_at, {HTTP_DATE_SQL}),
+        'image_url', posts.image_url,
+        'image_variants', posts.image_variants,
+        'like_count', posts.like_count,
+        'liked', EXISTS (SELECT 1 FROM likes WHERE likes.user_id = %s AND likes.post_id = posts.post_id),
+        'post_id', posts.post_id,
+        'poster_id', posts.poster_id,
+        'profile_picture', users.profile_picture,
+        'profile_picture_variants', users.profile_picture_variants,
+        'reply_count', posts.reply_count,
+        'title', posts.title,
+        'username', users.username
+    )
+"""
+
+# A reply as jsonify would render it; the one parameter is the viewer's user ID (or NULL)
+REPLY_JSON_SQL = f"""
+    json_build_object(
+        'body', replies.body,
+        'created_at', to_char(replies.created_at, {HTTP_DATE_SQL}),
+        'image_url', replies.image_url,
+        'like_count', replies.like_count,
+        'liked', EXISTS (SELECT 1 FROM likes WHERE likes.user_id = %s AND likes.reply_id = replies.reply_id),
+        'post_id', replies.post_id,
+        'profile_picture', reply_users.profile_picture,
+        'replier_id', replies.replier_id,
+        'reply_id', replies.reply_id,
+        'username', reply_users.username
+    )
+"""
+
+# The whole GET /posts/<post_id> document: the post plus every reply in thread order
+POST_WITH_REPLIES_JSON_QUERY = f"""
+    SELECT json_build_object(
+        'post', {POST_JSON_SQL},
+        'replies', COALESCE(
+            (
+                SELECT json_agg({REPLY_JSON_SQL} ORDER BY replies.created_at, replies.reply_id)
+                FROM replies
+                JOIN users AS reply_users ON replies.replier_id = reply_users.user_id
+                WHERE replies.post_id = posts.post_id
+            ),
+            '[]'::json
+        )
+    )::text AS document
+    FROM posts
+    JOIN users ON posts.poster_id = users.user_id
+    WHERE posts.post_id = %s
+"""
+
+# Respond with a JSON object whose raw_key holds already-serialized items, keys sorted like jsonify
+def raw_json_response(fields, raw_key, raw_items, status=200):
+    parts = []
+    for key in sorted({*fields, raw_key}):
+        value = "[" + ",".join(raw_items) + "]" if key == raw_key else app.json.dumps(fields[key])
+        parts.append(f"{json.dumps(key)}:{value}")
+    return app.response_class("{" + ",".join(parts) + "}", status=status, mimetype='application/json')
+
+# bcrypt settings: cost factor, worker processes per gunicorn worker, and how many hashes may be queued or running
+BCRYPT_CONFIG = {
+    'rounds': int(os.getenv('PLAYGRADE_BCRYPT_ROUNDS', 12)),
+    'workers': int(os.getenv('PLAYGRADE_BCRYPT_WORKERS', 2)),
+    'max_pending': int(os.getenv('PLAYGRADE_BCRYPT_MAX_PENDING', 8)),
+    'retry_after': int(os.getenv('PLAYGRADE_BCRYPT_RETRY_AFTER', 2))
+}
+
+# Raised when the bcrypt pool already has max_pending jobs
+class PasswordHasherBusy(Exception):
+    pass
+
+# bcrypt work as module-level functions so the process pool can pickle them
+def _hash_password(password, rounds):
+    return hashpw(password.encode('utf-8'), gensalt(rounds)).decode('utf-8')
+
+def _check_password(password, password_hash):
+    return checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+# Runs bcrypt in a dedicated process pool so login bursts cannot pin the request workers' CPU
+class PasswordHasher:
+    def __init__(self, rounds, workers, max_pending):
+        self.rounds = rounds
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        # Reject immediately rather than queueing behind a burst
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None  # A worker died; start a fresh pool on the next call
+            raise
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def check(self, password, password_hash):
+        return self._run(_check_password, password, password_hash)
+
+    # Hashes look like $2b$12$...; the second field is the cost factor they were made with
+    def needs_rehash(self, password_hash):
+        parts = password_hash.split('$')
+        return len(parts) < 4 or parts[2] != f"{self.rounds:02d}"
+
+password_hasher = PasswordHasher(BCRYPT_CONFIG['rounds'], BCRYPT_CONFIG['workers'], BCRYPT_CONFIG['max_pending'])
+
+# 503 response telling the client when to retry a password operation
+def password_hasher_busy_response():
+    response = jsonify({"error": "Server is busy, please try again shortly"})
+    response.headers['Retry-After'] = str(BCRYPT_CONFIG['retry_after'])
+    return response, 503
+
+# Verified JWT claims keyed by a SHA-256 digest of the token, so raw tokens are never held in memory
+token_cache = LRUCache(
+    int(os.getenv('PLAYGRADE_TOKEN_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('PLAYGRADE_TOKEN_CACHE_TTL', 300))
+)
+
+# users.token_version per user ID (None for deleted users). Revocations are written to the database, so the TTL
+# bounds how long another worker keeps accepting a revoked token.
+token_versions = LRUCache(
+    int(os.getenv('PLAYGRADE_TOKEN_VERSION_CACHE_SIZE', 100000)),
+    ttl=float(os.getenv('PLAYGRADE_TOKEN_VERSION_TTL', 5))
+)
+NO_USER = "no-user"  # Cached for user IDs with no row
+
+def current_token_version(user_id):
+    version = token_versions.get(user_id)
+    if version is None:
+        # Always the primary: a lagging replica could still show the version from before a revocation
+        with get_db_connection(primary=True) as conn, conn.cursor() as cur:
+            cur.execute("SELECT token_version FROM users WHERE user_id = %s", (user_id,))
+            row = cur.fetchone()
+        version = row[0] if row else NO_USER
+        token_versions.set(user_id, version)
+    return None if version == NO_USER else version
+
+# Verify a JWT, skipping signature verification for tokens seen recently, and reject tokens issued before the
+# user's latest revocation or for deleted users
+def decode_token(token):
+    digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    claims = token_cache.get(digest)
+    if claims is None:
+        claims = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        # An expiring token is cached no longer than it stays valid
+        ttl = token_cache.ttl
+        if 'exp' in claims:
+            ttl = min(ttl, claims['exp'] - time.time()) if ttl is not None else claims['exp'] - time.time()
+        token_cache.set(digest, claims, ttl=ttl)
+
+    version = current_token_version(claims.get('user_id'))
+    if version is None or claims.get('ver', 0) < version:
+        raise jwt.InvalidTokenError("Token has been revoked")
+    return claims
+
+# Reject a user's existing tokens in every worker, e.g. after a password change; runs in the caller's transaction.
+# Returns the new version for a replacement token.
+def revoke_user_tokens(cur, user_id):
+    cur.execute("UPDATE users SET token_version = token_version + 1 WHERE user_id = %s RETURNING token_version", (user_id,))
+    row = cur.fetchone()
+    token_versions.pop(user_id)
+    return row['token_version'] if isinstance(row, dict) else row[0]
+
+# Sign a token for a user at their current token version
+def issue_token(user_id, is_admin, token_version):
+    return jwt.encode(
+        {"user_id": user_id, "is_admin": is_admin, "ver": token_version, "iat": int(time.time())},
+        app.config['SECRET_KEY'],
+        algorithm="HS256"
+    )
 
 # Decode JWT and enforce authentication
 def token_required(f):
@@ -55,7 +1434,8 @@ def token_required(f):
             return jsonify({"error": "Authorization token is missing"}), 401
         try:
             token = token.replace("Bearer ", "") if token.startswith("Bearer ") else token
-            decoded = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            decoded = decode_token(token)
+            g.user_id = decoded.get('user_id')
             return f(decoded, *args, **kwargs)
         except jwt.InvalidTokenError:
             return jsonify({"error": "Invalid token"}), 401
@@ -70,12 +1450,779 @@ def token_optional(f):
             return f(None, *args, **kwargs)  # Guest user (no token)
         try:
             token = token.replace("Bearer ", "") if token.startswith("Bearer ") else token
-            decoded = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            decoded = decode_token(token)
+            g.user_id = decoded.get('user_id')
             return f(decoded, *args, **kwargs)
         except jwt.InvalidTokenError:
             return jsonify({"error": "Invalid token"}), 401
     return decorated
 
+# Users' most recent successful writes in this worker, kept for the read-your-writes window
+recent_writes = LRUCache(int(os.getenv('PLAYGRADE_RECENT_WRITES_USERS', 100000)), ttl=REPLICA_READ_YOUR_WRITES_WINDOW)
+
+# When the caller last wrote, from this worker's record of their user ID or the cookie/header echoed back
+# from an earlier write response (which may have been served by another worker)
+def last_write_time():
+    latest = recent_writes.get(g.get('user_id')) or 0.0
+    echoed = request.headers.get('X-Playgrade-Last-Write') or request.cookies.get('playgrade_last_write')
+    try:
+        latest = max(latest, float(echoed)) if echoed else latest
+    except ValueError:
+        pass
+    return latest
+
+# Let a read-only handler be served from the read replica
+def replica_read(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.replica_read = True
+        return f(*args, **kwargs)
+    return decorated
+
+# Stamp successful writes so the same user's next reads go to the primary until the replica has caught up
+@app.after_request
+def record_write(response):
+    if replica_pool is not None and request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        now = time.time()
+        if g.get('user_id') is not None:
+            recent_writes.set(g.user_id, now)
+        response.headers['X-Playgrade-Last-Write'] = f"{now:.3f}"
+        response.set_cookie(
+            'playgrade_last_write', f"{now:.3f}",
+            max_age=int(REPLICA_READ_YOUR_WRITES_WINDOW) + 1, httponly=True, samesite='Lax'
+        )
+    return response
+
+# Upload limits: bytes per image, largest width/height, total pixel budget, and how far into a file to look for its size
+UPLOAD_CONFIG = {
+    'max_bytes': int(os.getenv('PLAYGRADE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)),
+    'max_dimension': int(os.getenv('PLAYGRADE_UPLOAD_MAX_DIMENSION', 8192)),
+    'max_pixels': int(os.getenv('PLAYGRADE_UPLOAD_MAX_PIXELS', 40_000_000)),
+    'header_limit': int(os.getenv('PLAYGRADE_UPLOAD_HEADER_LIMIT', 1024 * 1024))
+}
+
+# Whole request bodies are capped at one image plus room for the text fields
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_CONFIG['max_bytes'] + 64 * 1024
+
+# Accepted image formats by magic bytes, with the extension stored files get
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif')
+]
+
+# JPEG start-of-frame markers, which carry the image size (C4, C8 and CC are other segment types)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# Raised while an upload is being received when it breaks the upload rules
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+# (width, height) from the start of an image, or None when more bytes are needed
+def image_dimensions(kind, head):
+    if kind == 'png':
+        if len(head) < 24:
+            return None
+        if head[12:16] != b'IHDR':
+            raise UploadRejected("Invalid PNG image")
+        return struct.unpack('>II', head[16:24])
+    if kind == 'gif':
+        return struct.unpack('<HH', head[6:10]) if len(head) >= 10 else None
+
+    # JPEG: walk the segment headers until a start-of-frame segment
+    pos = 2
+    while pos + 4 <= len(head):
+        if head[pos] != 0xFF:
+            raise UploadRejected("Invalid JPEG image")
+        marker = head[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # Fill byte
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2  # Standalone marker without a length
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > len(head):
+                return None
+            height, width = struct.unpack('>HH', head[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + struct.unpack('>H', head[pos + 2:pos + 4])[0]
+    return None
+
+# Uploads written to disk and uploads whose content was already stored, for this worker
+upload_store_counters = {'stored': 0, 'deduplicated': 0, 'bytes_deduplicated': 0}
+
+# Temp file an uploaded image is streamed into as Werkzeug parses the request, chunk by chunk.
+# The size cap, format and dimension budget are checked as bytes arrive, so a bad upload is rejected
+# without reading the rest of the body. commit() moves the file into the uploads folder under its content hash.
+class UploadStage:
+    def __init__(self, directory):
+        self.directory = directory
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._head = bytearray()
+        self._hash = hashlib.sha256()
+        self._committed = False
+        self.size = 0
+        self.kind = None
+        self.dimensions = None
+        self.filename = None
+
+    def write(self, data):
+        self.size += len(data)
+        try:
+            if self.size > UPLOAD_CONFIG['max_bytes']:
+                raise UploadRejected(f"Image must not exceed {UPLOAD_CONFIG['max_bytes']} bytes", 413)
+            if self.dimensions is None:
+                self._head += data[:UPLOAD_CONFIG['header_limit'] - len(self._head)]
+                self._inspect(final=False)
+        except UploadRejected:
+            self.close()
+            raise
+        self._hash.update(data)
+        return self._file.write(data)
+
+    # Identify the format and check the dimensions once enough of the file has arrived
+    def _inspect(self, final):
+        if self.kind is None:
+            if len(self._head) < 8 and not final:
+                return
+            self.kind = next((kind for signature, kind in IMAGE_SIGNATURES if self._head.startswith(signature)), None)
+            if self.kind is None:
+                raise UploadRejected("Invalid file type. Allowed: png, jpg, jpeg, gif")
+
+        dimensions = image_dimensions(self.kind, bytes(self._head))
+        if dimensions is None:
+            if final or len(self._head) >= UPLOAD_CONFIG['header_limit']:
+                raise UploadRejected("Could not read the image dimensions")
+            return
+
+        width, height = dimensions
+        if max(width, height) > UPLOAD_CONFIG['max_dimension'] or width * height > UPLOAD_CONFIG['max_pixels']:
+            raise UploadRejected(
+                f"Image dimensions must not exceed {UPLOAD_CONFIG['max_dimension']}px per side "
+                f"or {UPLOAD_CONFIG['max_pixels']} pixels in total"
+            )
+        self.dimensions = dimensions
+        self._head = bytearray()
+
+    # Validate what has been received and name the file by its content; called once the request body has been read
+    def finish(self):
+        if self.dimensions is None:
+            try:
+                self._inspect(final=True)
+            except UploadRejected:
+                self.close()
+                raise
+        if self.filename is None:
+            self.filename = f"{self._hash.hexdigest()}.{self.kind}"
+        return self
+
+    @property
+    def url(self):
+        return f"/uploads/{self.filename}"
+
+    # Atomically move the finished file to its final name, or drop it when the same content is already stored.
+    # Call after acquire_upload and the row write, before the transaction commits, so the stored file cannot be
+    # removed in between.
+    def commit(self):
+        self.finish()
+        target = os.path.join(self.directory, self.filename)
+        if os.path.exists(target):
+            upload_store_counters['deduplicated'] += 1
+            upload_store_counters['bytes_deduplicated'] += self.size
+            self.close()
+            return self.url
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path, target)
+        self._committed = True
+        upload_store_counters['stored'] += 1
+        return self.url
+
+    # Drop the temp file unless it was committed; Werkzeug closes request files when the request ends
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self._committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    # Reading, seeking and the rest of the file API go to the temp file
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+# Request class whose multipart file parts are received by UploadStage
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadStage(app.config['UPLOAD_FOLDER'])
+
+app.request_class = UploadRequest
+
+# Return a validated UploadStage for an uploaded file; acquire_upload() and commit() it to keep the file
+def stage_upload(file):
+    stage = file.stream
+    if not isinstance(stage, UploadStage):
+        # Not parsed by UploadRequest (e.g. a FileStorage built by hand); copy it through a stage for the same checks
+        stage = UploadStage(app.config['UPLOAD_FOLDER'])
+        for chunk in iter(lambda: file.stream.read(64 * 1024), b''):
+            stage.write(chunk)
+    return stage.finish()
+
+# Take a reference to a validated upload in the caller's transaction, returning its URL. Its row lock stays held until
+# the caller commits, so collect_uploads cannot remove the file meanwhile. The file is not moved here: call
+# upload.commit() once the row that points at it has been written, so a failed write leaves no stored file behind.
+def acquire_upload(cur, upload):
+    cur.execute(
+        """
+        INSERT INTO upload_refs (image_url, ref_count, size_bytes) VALUES (%s, 1, %s)
+        ON CONFLICT (image_url) DO UPDATE SET ref_count = upload_refs.ref_count + 1
+        """,
+        (upload.url, upload.size)
+    )
+    return upload.url
+
+# Drop one reference per URL (None entries are skipped) in the caller's transaction. Returns the URLs left without
+# references, to pass to collect_uploads once the transaction has committed.
+def release_uploads(cur, image_urls):
+    image_urls = [image_url for image_url in image_urls if image_url]
+    if not image_urls:
+        return []
+    with cur.connection.cursor() as refs:
+        refs.execute(
+            """
+            UPDATE upload_refs
+            SET ref_count = upload_refs.ref_count - released.count
+            FROM (
+                SELECT image_url, COUNT(*) AS count FROM unnest(%s::text[]) AS image_url GROUP BY image_url
+            ) released
+            WHERE upload_refs.image_url = released.image_url
+            RETURNING upload_refs.image_url, upload_refs.ref_count
+            """,
+            (image_urls,)
+        )
+        return [image_url for image_url, ref_count in refs.fetchall() if ref_count <= 0]
+
+# Remove uploads (and their variants) that still have no references, each under its upload_refs row lock
+def collect_uploads(image_urls):
+    if not image_urls:
+        return
+    with get_db_connection() as conn, conn.cursor() as cur:
+        for image_url in image_urls:
+            cur.execute("SELECT ref_count FROM upload_refs WHERE image_url = %s FOR UPDATE", (image_url,))
+            row = cur.fetchone()
+            if row is not None and row[0] <= 0:
+                remove_upload(image_url)
+                cur.execute("DELETE FROM upload_refs WHERE image_url = %s", (image_url,))
+            conn.commit()
+
+@app.errorhandler(UploadRejected)
+def upload_rejected(e):
+    return jsonify({"error": str(e)}), e.status
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({"error": f"Request body must not exceed {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
+# Pillow format names for the extensions variants are written with
+IMAGE_OUTPUT_FORMATS = {'avif': 'AVIF', 'webp': 'WEBP', 'jpg': 'JPEG', 'png': 'PNG', 'gif': 'GIF'}
+
+image_encoders = {}
+
+# Whether this Pillow build can write a format, found by encoding a 1x1 image once per process
+def image_encoder_available(fmt):
+    if fmt not in image_encoders:
+        try:
+            Image.new('RGB', (1, 1)).save(io.BytesIO(), format=IMAGE_OUTPUT_FORMATS[fmt])
+            image_encoders[fmt] = True
+        except Exception:
+            image_encoders[fmt] = False
+    return image_encoders[fmt]
+
+# Open an upload for re-encoding: the EXIF orientation is applied, the pixels converted to RGB(A) and all metadata but
+# the colour profile dropped. Animated GIFs keep their first frame. Returns the image and its ICC profile.
+def open_image_for_variants(path):
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        icc_profile = original.info.get('icc_profile')
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.mode in ('LA', 'PA') or 'transparency' in image.info else 'RGB')
+    image.info = {}
+    return image, icc_profile
+
+# Metadata keys Pillow reports for JPEG and PNG originals that can identify the uploader (GPS, camera serials, names)
+IMAGE_METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'photoshop', 'comment')
+
+# Rewrite a stored JPEG or PNG original in place without EXIF, XMP, IPTC or text chunks, upright and keeping its colour
+# profile. JPEGs that need no rotation keep their quantization tables, so the pixels are not re-compressed.
+# Returns False when the file carries none of that metadata and was left alone.
+def strip_image_metadata(path):
+    with Image.open(path) as original:
+        if original.format not in ('JPEG', 'PNG'):
+            return False
+        if not any(key in original.info for key in IMAGE_METADATA_KEYS) and not getattr(original, 'text', None):
+            return False
+
+        options = {'icc_profile': original.info['icc_profile']} if original.info.get('icc_profile') else {}
+        image = ImageOps.exif_transpose(original)
+        if original.format == 'JPEG':
+            rotated = original.getexif().get(ExifTags.Base.Orientation, 1) != 1
+            options['quality'] = 95 if rotated else 'keep'
+            if not rotated:
+                image = original
+        elif 'transparency' in original.info:
+            options['transparency'] = original.info['transparency']
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.original-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, format=original.format, **options)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return True
+
+# Fit an image within width x height (either may be None) without upscaling and write it atomically
+def save_image_variant(image, path, fmt, width=None, height=None, icc_profile=None):
+    image = image.copy()
+    if width or height:
+        image.thumbnail((width or image.width, height or image.height), Image.LANCZOS)
+    if fmt == 'jpg' and image.mode == 'RGBA':
+        image = image.convert('RGB')
+
+    # Only the colour profile is carried over; EXIF (GPS, camera serials) and XMP are not
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.variant-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            image.save(out, format=IMAGE_OUTPUT_FORMATS[fmt], quality=IMAGE_JOB_CONFIG['quality'], **options)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return os.path.getsize(path)
+
+# Post-processing of stored uploads: jobs are queued in Postgres with the row that references the image and run by a
+# background thread in each worker, so requests return as soon as the original is on disk. Without Pillow no jobs
+# are queued and the originals are served as they are.
+IMAGE_JOB_CONFIG = {
+    'enabled': os.getenv('PLAYGRADE_IMAGE_JOBS', '1' if Image is not None else '0') == '1',
+    'worker': os.getenv('PLAYGRADE_IMAGE_WORKER', '1') == '1' and Image is not None,
+    'poll_interval': float(os.getenv('PLAYGRADE_IMAGE_POLL_INTERVAL', 5.0)),
+    'lease': int(os.getenv('PLAYGRADE_IMAGE_JOB_LEASE', 300)),
+    'max_attempts': int(os.getenv('PLAYGRADE_IMAGE_JOB_ATTEMPTS', 5)),
+    'backoff': float(os.getenv('PLAYGRADE_IMAGE_JOB_BACKOFF', 30)),
+    'backoff_max': float(os.getenv('PLAYGRADE_IMAGE_JOB_BACKOFF_MAX', 3600)),
+    'quality': int(os.getenv('PLAYGRADE_IMAGE_QUALITY', 80)),
+    # Variant name and longest side in pixels, e.g. "feed:1080,thumb:320"
+    'sizes': {
+        name: int(side) for name, side in
+        (size.split(':') for size in os.getenv('PLAYGRADE_IMAGE_SIZES', 'feed:1080,thumb:320').split(','))
+    },
+    # Output formats in preference order; ones this Pillow build cannot encode are skipped
+    'formats': os.getenv('PLAYGRADE_IMAGE_FORMATS', 'avif,webp').split(',')
+}
+
+# Claim the oldest due job with attempts left. Claiming pushes run_at out by the lease, so a job whose worker died
+# is picked up again once the lease runs out and counts as a failed attempt.
+IMAGE_JOB_CLAIM_QUERY = """
+    UPDATE image_jobs
+    SET attempts = attempts + 1, run_at = (NOW() AT TIME ZONE 'UTC') + make_interval(secs => %s)
+    WHERE job_id = (
+        SELECT job_id FROM image_jobs
+        WHERE failed_at IS NULL AND attempts < %s AND run_at <= (NOW() AT TIME ZONE 'UTC')
+        ORDER BY run_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING job_id, target_type, target_id, image_url, attempts
+"""
+
+# Give up on jobs whose lease ran out on their last attempt, since no worker is left to record the failure
+IMAGE_JOB_EXPIRE_QUERY = """
+    UPDATE image_jobs
+    SET failed_at = (NOW() AT TIME ZONE 'UTC'), last_error = 'Lease expired on the last attempt'
+    WHERE failed_at IS NULL AND attempts >= %s AND run_at <= (NOW() AT TIME ZONE 'UTC')
+"""
+
+# Where each target type keeps its image and variants; variants are only recorded while the row still has the image
+IMAGE_JOB_TARGETS = {
+    'post': "UPDATE posts SET image_variants = %s WHERE post_id = %s AND image_url = %s",
+    'user': "UPDATE users SET profile_picture_variants = %s WHERE user_id = %s AND profile_picture = %s"
+}
+
+# Queue post-processing for an image in the caller's transaction; call image_job_worker.notify() after committing
+def enqueue_image_job(cur, target_type, target_id, image_url):
+    if not IMAGE_JOB_CONFIG['enabled']:
+        return
+    cur.execute(
+        "INSERT INTO image_jobs (target_type, target_id, image_url) VALUES (%s, %s, %s)",
+        (target_type, target_id, image_url)
+    )
+
+# Remove an upload and any variants generated from it
+def remove_upload(image_url):
+    name = os.path.basename(image_url)
+    stem = os.path.splitext(name)[0]
+    names = [name] + [f"{stem}-{size}.{fmt}" for size in IMAGE_JOB_CONFIG['sizes'] for fmt in IMAGE_JOB_CONFIG['formats']]
+    for name in names:
+        path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+        if os.path.exists(path):
+            os.remove(path)
+
+class ImageJobWorker:
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._wake = threading.Event()
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    # Start the thread on first use in each process, so forked workers get their own
+    def ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name='image-jobs', daemon=True).start()
+                self._pid = os.getpid()
+
+    # Wake the thread for a job that was just committed instead of waiting for the next poll
+    def notify(self):
+        if IMAGE_JOB_CONFIG['enabled'] and IMAGE_JOB_CONFIG['worker'] and not app.testing:
+            self.ensure_running()
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                while self.run_once():
+                    pass  # Keep going while jobs are due
+            except Exception:
+                app.logger.exception("Running image jobs failed")
+
+    # Configured formats this Pillow build can encode
+    def formats(self):
+        return [fmt for fmt in IMAGE_JOB_CONFIG['formats'] if image_encoder_available(fmt)]
+
+    # Claim and run one job; returns False when none are due
+    def run_once(self):
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(IMAGE_JOB_EXPIRE_QUERY, (IMAGE_JOB_CONFIG['max_attempts'],))
+            self.failed += cur.rowcount
+            cur.execute(IMAGE_JOB_CLAIM_QUERY, (IMAGE_JOB_CONFIG['lease'], IMAGE_JOB_CONFIG['max_attempts']))
+            job = cur.fetchone()
+            conn.commit()
+        if job is None:
+            return False
+
+        # The connection goes back to the pool while the image is processed
+        try:
+            variants = self.render(job['image_url'])
+        except Exception as e:
+            self.retry(job, e)
+            return True
+
+        with get_db_connection() as conn, conn.cursor() as cur:
+            recorded = 0
+            if variants is not None:
+                cur.execute(
+                    IMAGE_JOB_TARGETS[job['target_type']],
+                    (Json(variants), job['target_id'], job['image_url'])
+                )
+                recorded = cur.rowcount
+            cur.execute("DELETE FROM image_jobs WHERE job_id = %s", (job['job_id'],))
+            conn.commit()
+        if variants is not None and not recorded:
+            # The post was deleted or the picture replaced while the job ran. Other rows may share the image, so
+            # the variants only go if the original has been removed too.
+            if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(job['image_url']))):
+                remove_upload(job['image_url'])
+        elif recorded:
+            invalidate_feed_cache()
+        self.completed += 1
+        return True
+
+    # Schedule another attempt with exponential backoff, or give up after max_attempts
+    def retry(self, job, error):
+        app.logger.warning("Image job %s failed (attempt %s): %s", job['job_id'], job['attempts'], error)
+        with get_db_connection() as conn, conn.cursor() as cur:
+            if job['attempts'] >= IMAGE_JOB_CONFIG['max_attempts']:
+                cur.execute(
+                    "UPDATE image_jobs SET failed_at = (NOW() AT TIME ZONE 'UTC'), last_error = %s WHERE job_id = %s",
+                    (str(error), job['job_id'])
+                )
+                self.failed += 1
+            else:
+                delay = min(IMAGE_JOB_CONFIG['backoff'] * 2 ** (job['attempts'] - 1), IMAGE_JOB_CONFIG['backoff_max'])
+                cur.execute(
+                    """
+                    UPDATE image_jobs
+                    SET run_at = (NOW() AT TIME ZONE 'UTC') + make_interval(secs => %s), last_error = %s
+                    WHERE job_id = %s
+                    """,
+                    (delay * random.uniform(0.75, 1.25), str(error), job['job_id'])
+                )
+                self.retried += 1
+            conn.commit()
+
+    # Write variants of an upload at each configured size and format, returning their URLs by size and format, or None
+    # when the original is already gone
+    def render(self, image_url):
+        folder = app.config['UPLOAD_FOLDER']
+        name = os.path.basename(image_url)
+        source = os.path.join(folder, name)
+        if not os.path.exists(source):
+            return None
+
+        # The original is what image_url serves, so it loses its EXIF (GPS included) before any variant is made
+        strip_image_metadata(source)
+
+        # Uploads are named by content, so variants already written for another post with the same image are reused
+        stem = os.path.splitext(name)[0]
+        variants, written = {}, []
+        image = None
+        try:
+            for size, side in IMAGE_JOB_CONFIG['sizes'].items():
+                for fmt in self.formats():
+                    filename = f"{stem}-{size}.{fmt}"
+                    if not os.path.exists(os.path.join(folder, filename)):
+                        if image is None:
+                            image, icc_profile = open_image_for_variants(source)
+                        save_image_variant(image, os.path.join(folder, filename), fmt, side, side, icc_profile)
+                        written.append(filename)
+                    variants.setdefault(size, {})[fmt] = f"/uploads/{filename}"
+        except Exception:
+            for filename in written:
+                os.remove(os.path.join(folder, filename))
+            raise
+        return variants
+
+    def stats(self):
+        return {
+            "enabled": IMAGE_JOB_CONFIG['enabled'],
+            "worker": IMAGE_JOB_CONFIG['worker'],
+            "formats": self.formats() if Image is not None else [],
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+image_job_worker = ImageJobWorker(IMAGE_JOB_CONFIG['poll_interval'])
+
+# Background threads start with the first request each worker process serves, never on import: the bcrypt pool's
+# children, migrate.py and the check and benchmark scripts import this module too. Test clients (app.testing) skip them.
+@app.before_request
+def start_background_workers():
+    if app.testing:
+        return
+    if like_queue.enabled:
+        like_queue.ensure_running()  # Replay anything journaled before a crash without waiting for new likes
+    if LIKE_COUNTER_CONFIG['shards'] > 0:
+        like_counter_folder.ensure_running()  # Fold shard deltas left from before a restart without waiting for new likes
+    if IMAGE_JOB_CONFIG['enabled'] and IMAGE_JOB_CONFIG['worker']:
+        image_job_worker.ensure_running()  # Pick up jobs queued before a restart without waiting for new uploads
+
+# On-demand resized copies of uploads (/uploads/<file>?w=&h=&fmt=), kept in a directory capped by total bytes
+RESIZE_CONFIG = {
+    'folder': os.getenv('PLAYGRADE_RESIZE_CACHE_DIR', './upload-cache'),
+    'max_bytes': int(os.getenv('PLAYGRADE_RESIZE_CACHE_BYTES', 512 * 1024 * 1024)),
+    # Widths/heights that may be requested; anything else is rejected so one-off sizes cannot fill the cache
+    'sizes': {int(size) for size in os.getenv('PLAYGRADE_RESIZE_SIZES', '32,64,128,256,320,640,1080').split(',')},
+    'formats': os.getenv('PLAYGRADE_RESIZE_FORMATS', 'webp,avif,jpg,png').split(','),
+    # Hits refresh a file's mtime, which eviction orders by, at most this often (seconds)
+    'touch_interval': int(os.getenv('PLAYGRADE_RESIZE_TOUCH_INTERVAL', 60))
+}
+os.makedirs(RESIZE_CONFIG['folder'], exist_ok=True)
+
+# Raised when the w, h or fmt query arguments of an upload request are not allowed
+class InvalidResizeArgs(ValueError):
+    pass
+
+# Validate w, h and fmt query arguments; returns (width, height, fmt) or None when no resize was asked for
+def parse_resize_args(args, filename):
+    if not any(args.get(name) for name in ('w', 'h', 'fmt')):
+        return None
+
+    dimensions = []
+    for name in ('w', 'h'):
+        value = args.get(name)
+        if not value:
+            dimensions.append(None)
+            continue
+        try:
+            value = int(value)
+        except ValueError:
+            raise InvalidResizeArgs(f"{name} must be an integer")
+        if value not in RESIZE_CONFIG['sizes']:
+            raise InvalidResizeArgs(f"{name} must be one of {sorted(RESIZE_CONFIG['sizes'])}")
+        dimensions.append(value)
+
+    # Without fmt the copy keeps the stored format
+    stored_fmt = os.path.splitext(filename)[1].lstrip('.').lower().replace('jpeg', 'jpg')
+    fmt = args.get('fmt') or stored_fmt
+    if fmt != stored_fmt and fmt not in RESIZE_CONFIG['formats']:
+        raise InvalidResizeArgs(f"fmt must be one of {RESIZE_CONFIG['formats']}")
+    if fmt not in IMAGE_OUTPUT_FORMATS or not image_encoder_available(fmt):
+        raise InvalidResizeArgs(f"fmt {fmt} is not supported by this server")
+    return dimensions[0], dimensions[1], fmt
+
+class ResizeCache:
+    def __init__(self, folder, max_bytes, stripes=64):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        # Variants hash onto a fixed set of locks (plus a lock file each, for other processes) so that concurrent
+        # requests for one variant render it once
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._size_lock = threading.Lock()
+        self._size = None  # Bytes on disk as of the last scan plus what this process has written since
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+
+    # Path of a resized upload, rendering it on first request
+    def get(self, filename, width, height, fmt):
+        key = f"{os.path.splitext(filename)[0]}-{width or 0}x{height or 0}.{fmt}"
+        path = os.path.join(self.folder, key)
+        if self._touch(path):
+            self.hits += 1
+            return path
+
+        stripe = zlib.crc32(key.encode()) % len(self._stripes)
+        with self._stripes[stripe], self._file_lock(stripe):
+            if os.path.exists(path):
+                # Rendered by the request we waited on
+                self.coalesced += 1
+                return path
+            self.misses += 1
+            image, icc_profile = open_image_for_variants(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            size = save_image_variant(image, path, fmt, width, height, icc_profile)
+        self._account(path, size)
+        return path
+
+    # Record a hit by bumping the mtime; False when the variant is not cached
+    def _touch(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        now = time.time()
+        if now - mtime > RESIZE_CONFIG['touch_interval']:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                return False  # Evicted in between
+        return True
+
+    @contextmanager
+    def _file_lock(self, stripe):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.folder, f".lock-{stripe:02d}"), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # Released when the file is closed
+            yield
+
+    # Cached variants as (mtime, size, path), skipping lock and temp files
+    def _scan(self):
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    # Count a new variant and, once over budget, evict least recently used variants down to 90% of it, sparing the new
+    # one that is about to be sent. Other processes write here too, so eviction works from a fresh scan rather than
+    # this process's running total.
+    def _account(self, new_path, size):
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(entry_size for _, entry_size, _ in self._scan())
+            else:
+                self._size += size
+            if self._size <= self.max_bytes:
+                return
+
+            entries = sorted(self._scan())
+            total = sum(entry_size for _, entry_size, _ in entries)
+            for _, entry_size, path in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                if path == new_path:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= entry_size
+                self.evicted_files += 1
+                self.evicted_bytes += entry_size
+            self._size = total
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "evicted_files": self.evicted_files,
+            "evicted_bytes": self.evicted_bytes
+        }
+
+resize_cache = ResizeCache(RESIZE_CONFIG['folder'], RESIZE_CONFIG['max_bytes'])
+
+# Uploads and their resized copies never change once written (names are unique per image), so clients and CDNs may
+# keep them for max_age without revalidating. Bodies can be handed to a fronting proxy: 'x-sendfile' (Apache,
+# lighttpd) or 'x-accel-redirect' (nginx, with internal locations aliasing the two directories at the given prefixes).
+UPLOAD_SERVING_CONFIG = {
+    'max_age': int(os.getenv('PLAYGRADE_UPLOAD_MAX_AGE', 365 * 24 * 60 * 60)),
+    'offload': os.getenv('PLAYGRADE_UPLOAD_OFFLOAD', ''),
+    'accel_uploads': os.getenv('PLAYGRADE_X_ACCEL_UPLOADS', '/internal/uploads/'),
+    'accel_resized': os.getenv('PLAYGRADE_X_ACCEL_RESIZED', '/internal/upload-cache/')
+}
+app.config['USE_X_SENDFILE'] = UPLOAD_SERVING_CONFIG['offload'] in ('x-sendfile', 'x-accel-redirect')
+
+# Send a file from the uploads folder or resize cache with a strong ETag and immutable caching. Served here, werkzeug
+# answers If-None-Match/If-Modified-Since and Range requests and passes the open file to the WSGI server's
+# file_wrapper (sendfile under gunicorn). Offloaded, only revalidations are answered here and the proxy sends the
+# body, ranges included.
+def send_upload(directory, filename, accel_prefix):
+    offload = UPLOAD_SERVING_CONFIG['offload']
+    response = send_from_directory(
+        directory, filename, as_attachment=False, etag=filename, max_age=UPLOAD_SERVING_CONFIG['max_age'],
+        conditional=not offload
+    )
+    if offload:
+        if offload == 'x-accel-redirect':
+            response.headers.pop('X-Sendfile')
+            response.headers['X-Accel-Redirect'] = accel_prefix + quote(filename)
+            del response.headers['Content-Length']  # nginx sets it for the file it sends
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            # Nothing for the proxy to send
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+    response.cache_control.immutable = True
+    return response
+
 # Serve uploaded images
 @app.route('/uploads/<path:filename>', methods=['GET'])
 def serve_uploaded_file(filename):
@@ -93,9 +2240,30 @@ def serve_uploaded_file(filename):
         schema:
           type: string
           example: "sample.jpg"
+      - name: w
+        in: query
+        required: false
+        description: Fit the image within this width. Must be one of the allowed sizes (PLAYGRADE_RESIZE_SIZES).
+        schema:
+          type: integer
+          example: 64
+      - name: h
+        in: query
+        required: false
+        description: Fit the image within this height. Must be one of the allowed sizes.
+        schema:
+          type: integer
+          example: 64
+      - name: fmt
+        in: query
+        required: false
+        description: Output format (webp, avif, jpg or png); defaults to the stored format.
+        schema:
+          type: string
+          example: "webp"
     responses:
       200:
-        description: File served successfully.
+        description: File served successfully. Resized copies are rendered on first request and then served from a disk cache.
         content:
           application/octet-stream:
             schema:
@@ -107,6 +2275,20 @@ def serve_uploaded_file(filename):
             schema:
               type: string
               example: "image/jpeg"
+          ETag:
+            description: Strong validator; the file name, since stored files never change.
+            schema:
+              type: string
+          Cache-Control:
+            description: public, max-age=PLAYGRADE_UPLOAD_MAX_AGE, immutable
+            schema:
+              type: string
+      206:
+        description: The part of the file asked for with a Range header.
+      304:
+        description: Not modified; If-None-Match matched the ETag.
+      400:
+        description: Size or format not allowed.
       404:
         description: File not found.
         content:
@@ -129,9 +2311,25 @@ def serve_uploaded_file(filename):
                   example: "Internal server error occurred."
     """
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=False)
-    except FileNotFoundError:
+        # Uploads are stored flat; dotfiles are uploads still being received
+        if filename != os.path.basename(filename) or filename.startswith('.'):
+            return jsonify({"error": "File not found"}), 404
+
+        # Without Pillow the stored file is served whatever was asked for
+        resize = parse_resize_args(request.args, filename) if Image is not None else None
+        if resize:
+            if not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], filename)):
+                return jsonify({"error": "File not found"}), 404
+            path = resize_cache.get(filename, *resize)
+            return send_upload(RESIZE_CONFIG['folder'], os.path.basename(path), UPLOAD_SERVING_CONFIG['accel_resized'])
+
+        return send_upload(app.config['UPLOAD_FOLDER'], filename, UPLOAD_SERVING_CONFIG['accel_uploads'])
+    except InvalidResizeArgs as e:
+        return jsonify({"error": str(e)}), 400
+    except (FileNotFoundError, NotFound):
         return jsonify({"error": "File not found"}), 404
+    except RequestedRangeNotSatisfiable as e:
+        return e
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -205,38 +2403,42 @@ def register():
         return jsonify({"error": "All fields are required"}), 400
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Check if username or email already exists
-        cur.execute("SELECT username, email FROM users WHERE username = %s OR email = %s", (username, email))
-        result = cur.fetchone()
+        # Check if username or email already exists, so duplicates are turned away without spending a hash
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT username, email FROM users WHERE username = %s OR email = %s", (username, email))
+            result = cur.fetchone()
         if result:
             if result['username'] == username:
                 return jsonify({"error": "Username already exists"}), 400
             if result['email'] == email:
                 return jsonify({"error": "Email already exists"}), 400
 
-        # Hash password using salt
-        hashed_password = hashpw(password.encode('utf-8'), gensalt())
+        # Hash password using salt, without holding a database connection
+        hashed_password = password_hasher.hash(password)
 
-        # Insert new user
-        cur.execute(
-            "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING user_id",
-            (username, email, hashed_password.decode('utf-8'))
-        )
-        user_id = cur.fetchone()['user_id']
-        conn.commit()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Insert new user
+            cur.execute(
+                "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING user_id",
+                (username, email, hashed_password)
+            )
+            user_id = cur.fetchone()['user_id']
+            conn.commit()
+
+            return jsonify({"message": "User registered successfully", "user_id": user_id}), 201
 
-        return jsonify({"message": "User registered successfully", "user_id": user_id}), 201
+    except psycopg2.errors.UniqueViolation as e:
+        # Another registration took the username or email while the password was being hashed
+        if e.diag.constraint_name == 'users_username_key':
+            return jsonify({"error": "Username already exists"}), 400
+        return jsonify({"error": "Email already exists"}), 400
+
+    except PasswordHasherBusy:
+        return password_hasher_busy_response()
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Login user
 @app.route('/users/login', methods=['POST'])
 def login():
@@ -291,75 +2493,78 @@ def login():
         return jsonify({"error": "Email and password are required"}), 400
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
         # Fetch user by email
-        cur.execute("SELECT * FROM users WHERE email = %s", (email,))
-        user = cur.fetchone()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT * FROM users WHERE email = %s", (email,))
+            user = cur.fetchone()
 
-        if not user or not checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+        # Verify the password without holding a database connection
+        if not user or not password_hasher.check(password, user['password_hash']):
             return jsonify({"error": "Invalid email or password"}), 400
 
+        # Upgrade the stored hash when the configured cost factor has changed
+        if password_hasher.needs_rehash(user['password_hash']):
+            try:
+                new_hash = password_hasher.hash(password)
+                with get_db_connection() as conn, conn.cursor() as cur:
+                    cur.execute(
+                        "UPDATE users SET password_hash = %s WHERE user_id = %s AND password_hash = %s",
+                        (new_hash, user['user_id'], user['password_hash'])
+                    )
+                    conn.commit()
+            except PasswordHasherBusy:
+                pass  # Try again on a later login
+
         # Create JWT token
-        token = jwt.encode(
-            {
-                "user_id": user['user_id'],
-                "is_admin": user['is_admin']
-            },
-            app.config['SECRET_KEY'],
-            algorithm="HS256"
-        )
+        token = issue_token(user['user_id'], user['is_admin'], user['token_version'])
 
         return jsonify({"message": "Login successful", "token": token}), 200
 
+    except PasswordHasherBusy:
+        return password_hasher_busy_response()
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Get user details
 @app.route('/users/<int:user_id>', methods=['GET'])
+@replica_read
 @token_optional  # Allows logged-in users but supports guests
 def get_user(current_user, user_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Query user details
-        cur.execute("SELECT user_id, username, profile_picture FROM users WHERE user_id = %s", (user_id,))
-        user = cur.fetchone()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Query user details
+            execute_prepared(
+                cur, "SELECT user_id, username, profile_picture, profile_picture_variants FROM users WHERE user_id = %s", (user_id,)
+            )
+            user = cur.fetchone()
 
-        if not user:
-            return jsonify({"error": "User not found"}), 404
+            if not user:
+                return jsonify({"error": "User not found"}), 404
 
-        # Default value for is_following
-        is_following = False
+            # Default value for is_following
+            is_following = False
 
-        # If authenticated, check if following
-        if current_user:
-            cur.execute(
-                "SELECT 1 FROM follows WHERE follower_id = %s AND followee_id = %s",
-                (current_user['user_id'], user_id)
-            )
-            is_following = cur.fetchone() is not None
+            # If authenticated, check if following
+            if current_user:
+                execute_prepared(
+                    cur,
+                    "SELECT 1 FROM follows WHERE follower_id = %s AND followee_id = %s",
+                    (current_user['user_id'], user_id)
+                )
+                is_following = cur.fetchone() is not None
 
-        return jsonify({
-            "user_id": user['user_id'],
-            "username": user['username'],
-            "profile_picture": user.get('profile_picture', None),
-            "is_following": is_following
-        }), 200
+            return jsonify({
+                "user_id": user['user_id'],
+                "username": user['username'],
+                "profile_picture": user.get('profile_picture', None),
+                "profile_picture_variants": user.get('profile_picture_variants', None),
+                "is_following": is_following
+            }), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Update user profile picture
 @app.route('/users/<int:user_id>/profile-picture', methods=['PATCH'])
 @token_required
@@ -399,56 +2604,45 @@ def update_display_picture(decoded_token, user_id):
     """
     current_user_id = decoded_token['user_id']
     is_admin = decoded_token['is_admin']
-    conn = None
-    cur = None
-
-    try:
-        file = request.files.get('image')
-        if not file:
-            return jsonify({"error": "Image file is required"}), 400
 
-        # Validate file type
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
-        if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
-            return jsonify({"error": "Invalid file type. Allowed: png, jpg, jpeg, gif"}), 400
+    file = request.files.get('image')
+    if not file:
+        return jsonify({"error": "Image file is required"}), 400
 
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(filepath)
-        profile_picture_url = f"/uploads/{unique_filename}"
+    # Validate the image; it is stored once the user has been checked
+    upload = stage_upload(file)
 
+    try:
         # Initialize DB connection
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Ensure user exists
-        cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-        user = cur.fetchone()
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-
-        # Check permissions
-        if current_user_id != user_id and not is_admin:
-            return jsonify({"error": "Unauthorized action"}), 403
-
-        # Update profile picture
-        cur.execute("UPDATE users SET profile_picture = %s WHERE user_id = %s", (profile_picture_url, user_id))
-        conn.commit()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Ensure user exists
+            cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+            user = cur.fetchone()
+            if not user:
+                return jsonify({"error": "User not found"}), 404
+
+            # Check permissions
+            if current_user_id != user_id and not is_admin:
+                return jsonify({"error": "Unauthorized action"}), 403
+
+            # Update profile picture, clearing variants of the previous one, and queue its post-processing
+            profile_picture_url = acquire_upload(cur, upload)
+            cur.execute(
+                "UPDATE users SET profile_picture = %s, profile_picture_variants = NULL WHERE user_id = %s",
+                (profile_picture_url, user_id)
+            )
+            enqueue_image_job(cur, 'user', user_id, profile_picture_url)
+            unreferenced = release_uploads(cur, [user['profile_picture']])
+            upload.commit()
+            conn.commit()
+            collect_uploads(unreferenced)
+            image_job_worker.notify()
 
-        return jsonify({"message": "Profile picture updated successfully", "profile_picture": profile_picture_url}), 200
+            return jsonify({"message": "Profile picture updated successfully", "profile_picture": profile_picture_url}), 200
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-
 # Update username
 @app.route('/users/<int:user_id>/username', methods=['PATCH'])
 @token_required
@@ -502,40 +2696,33 @@ def update_username(decoded_token, user_id):
             return jsonify({"error": "Missing username field"}), 400
 
         # Ensure username is unique
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM users WHERE username = %s", (new_username,))
-        existing_user = cur.fetchone()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT * FROM users WHERE username = %s", (new_username,))
+            existing_user = cur.fetchone()
 
-        if existing_user:
-            return jsonify({"error": "Username is already taken"}), 400
+            if existing_user:
+                return jsonify({"error": "Username is already taken"}), 400
 
-        # Ensure user exists
-        cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-        user = cur.fetchone()
+            # Ensure user exists
+            cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+            user = cur.fetchone()
 
-        if not user:
-            return jsonify({"error": "User not found"}), 404
+            if not user:
+                return jsonify({"error": "User not found"}), 404
 
-        # Check permissions
-        if current_user_id != user_id and not is_admin:
-            return jsonify({"error": "Unauthorized action"}), 403
+            # Check permissions
+            if current_user_id != user_id and not is_admin:
+                return jsonify({"error": "Unauthorized action"}), 403
 
-        # Update username
-        cur.execute("UPDATE users SET username = %s WHERE user_id = %s", (new_username, user_id))
-        conn.commit()
+            # Update username
+            cur.execute("UPDATE users SET username = %s WHERE user_id = %s", (new_username, user_id))
+            conn.commit()
 
-        return jsonify({"message": "Username updated successfully", "username": new_username}), 200
+            return jsonify({"message": "Username updated successfully", "username": new_username}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-
 # Update user password
 @app.route('/users/<int:user_id>/password', methods=['PATCH'])
 @token_required
@@ -572,7 +2759,15 @@ def update_password(decoded_token, user_id):
               example: "NewSecurePassword456"
     responses:
       200:
-        description: Password updated successfully.
+        description: Password updated successfully. Existing tokens for the user stop working; a user changing their own password gets a replacement in token.
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+            token:
+              type: string
+              example: <JWT token>
       400:
         description: Invalid request (e.g., missing fields).
       401:
@@ -597,12 +2792,10 @@ def update_password(decoded_token, user_id):
         return jsonify({"error": "Both current_password and new_password are required"}), 400
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Fetch user
-        cur.execute("SELECT password_hash FROM users WHERE user_id = %s", (user_id,))
-        user = cur.fetchone()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Fetch user
+            cur.execute("SELECT password_hash FROM users WHERE user_id = %s", (user_id,))
+            user = cur.fetchone()
 
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -612,25 +2805,30 @@ def update_password(decoded_token, user_id):
             return jsonify({"error": "Unauthorized action"}), 403
 
         # Verify current password
-        if not checkpw(current_password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+        if not password_hasher.check(current_password, user['password_hash']):
             return jsonify({"error": "Incorrect current password"}), 401
 
         # Hash the new password
-        hashed_password = hashpw(new_password.encode('utf-8'), gensalt()).decode('utf-8')
-
-        # Update password in the database
-        cur.execute("UPDATE users SET password_hash = %s WHERE user_id = %s", (hashed_password, user_id))
-        conn.commit()
+        hashed_password = password_hasher.hash(new_password)
+
+        # Update password in the database, revoking the user's existing tokens
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE users SET password_hash = %s WHERE user_id = %s", (hashed_password, user_id))
+            token_version = revoke_user_tokens(cur, user_id)
+            conn.commit()
+
+        # A user changing their own password gets a replacement for the token they just used
+        response = {"message": "Password updated successfully"}
+        if current_user_id == user_id:
+            response["token"] = issue_token(user_id, is_admin, token_version)
+        return jsonify(response), 200
 
-        return jsonify({"message": "Password updated successfully"}), 200
+    except PasswordHasherBusy:
+        return password_hasher_busy_response()
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Delete user account
 @app.route('/users/<int:user_id>', methods=['DELETE'])
 @token_required
@@ -665,35 +2863,45 @@ def delete_user(decoded_token, user_id):
 
   try:
       # Ensure user exists
-      conn = get_db_connection()
-      cur = conn.cursor(cursor_factory=RealDictCursor)
-      cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-      user = cur.fetchone()
-
-      if not user:
-          return jsonify({"error": "User not found"}), 404
-
-      # Check permissions
-      if current_user_id != user_id and not is_admin:
-          return jsonify({"error": "Unauthorized action"}), 403
-
-      # Delete user
-      try:
-          cur.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
-          conn.commit()
-      except Exception as e:
-          conn.rollback()
-          return jsonify({"error": str(e)}), 500
-
-      return jsonify({"message": "User account deleted successfully"}), 200
+      with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+          cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+          user = cur.fetchone()
+
+          if not user:
+              return jsonify({"error": "User not found"}), 404
+
+          # Check permissions
+          if current_user_id != user_id and not is_admin:
+              return jsonify({"error": "Unauthorized action"}), 403
+
+          # Delete user, releasing their profile picture and the images of posts and replies deleted with them
+          try:
+              cur.execute(
+                  """
+                  SELECT profile_picture AS image_url FROM users WHERE user_id = %s
+                  UNION ALL
+                  SELECT image_url FROM posts WHERE poster_id = %s
+                  UNION ALL
+                  SELECT image_url FROM replies
+                  WHERE replier_id = %s OR post_id IN (SELECT post_id FROM posts WHERE poster_id = %s)
+                  """,
+                  (user_id, user_id, user_id, user_id)
+              )
+              unreferenced = release_uploads(cur, [row['image_url'] for row in cur.fetchall()])
+              cur.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+              conn.commit()
+              collect_uploads(unreferenced)
+              token_versions.pop(user_id)  # Without a users row, the user's tokens are rejected
+              invalidate_feed_cache()
+          except Exception as e:
+              conn.rollback()
+              return jsonify({"error": str(e)}), 500
+
+          return jsonify({"message": "User account deleted successfully"}), 200
 
   except Exception as e:
       return jsonify({"error": str(e)}), 500
 
-  finally:
-      cur.close()
-      conn.close()
-
 # Create new post
 @app.route('/posts', methods=['POST'])
 @token_required
@@ -763,43 +2971,37 @@ def create_post(decoded_token):
     if not file:
         return jsonify({"error": "Image file is required"}), 400
 
-    # Validate file type
-    if '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}:
-        # Generate a unique filename
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        # Save the file
-        file.save(filepath)
-        image_url = f"/uploads/{unique_filename}"
-    else:
-        return jsonify({"error": "Invalid file type. Allowed: png, jpg, jpeg, gif"}), 400
+    # Validate the image; it is stored with the post
+    upload = stage_upload(file)
 
     try:
         # Insert the post into the database
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(
-            """
-            INSERT INTO posts (poster_id, title, body, category, image_url)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING post_id
-            """,
-            (user_id, title, body, category, image_url)
-        )
-        post_id = cur.fetchone()['post_id']
-        conn.commit()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            image_url = acquire_upload(cur, upload)
+            cur.execute(
+                """
+                INSERT INTO posts (poster_id, title, body, category, image_url)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING post_id
+                """,
+                (user_id, title, body, category, image_url)
+            )
+            post_id = cur.fetchone()['post_id']
 
-        # Return success message and post_id
-        return jsonify({"message": "Post created successfully", "post_id": post_id}), 201
+            # Deliver the post to followers' home timelines and queue post-processing of its image
+            fan_out_post(cur, post_id)
+            enqueue_image_job(cur, 'post', post_id, image_url)
+            upload.commit()
+            conn.commit()
+            invalidate_feed_cache()
+            image_job_worker.notify()
+
+            # Return success message and post_id
+            return jsonify({"message": "Post created successfully", "post_id": post_id}), 201
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Delete post
 @app.route('/posts/<int:post_id>', methods=['DELETE'])
 @token_required
@@ -835,40 +3037,38 @@ def delete_post(decoded_token, post_id):
     is_admin = decoded_token['is_admin']
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT poster_id, image_url FROM posts WHERE post_id = %s", (post_id,))
-        post = cur.fetchone()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT poster_id, image_url FROM posts WHERE post_id = %s", (post_id,))
+            post = cur.fetchone()
+
+            if not post:
+                return jsonify({"error": "Post not found"}), 404
 
-        if not post:
-            return jsonify({"error": "Post not found"}), 404
+            if not (post['poster_id'] == user_id or is_admin):
+                return jsonify({"error": "You are not authorized to delete this post"}), 403
 
-        if not (post['poster_id'] == user_id or is_admin):
-            return jsonify({"error": "You are not authorized to delete this post"}), 403
+            # Release the post's image and those of the replies deleted along with it
+            cur.execute("SELECT image_url FROM replies WHERE post_id = %s AND image_url IS NOT NULL", (post_id,))
+            image_urls = [post['image_url']] + [reply['image_url'] for reply in cur.fetchall()]
+            unreferenced = release_uploads(cur, image_urls)
 
-        # Delete the image file
-        image_url = post.get('image_url')
-        if image_url:
-            # Convert relative URL to absolute file path
-            absolute_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(image_url))
-            if os.path.exists(absolute_path):
-                os.remove(absolute_path)
+            # Delete the post from the database and from any home timelines
+            cur.execute("DELETE FROM timeline WHERE post_id = %s", (post_id,))
+            cur.execute("DELETE FROM posts WHERE post_id = %s", (post_id,))
+            conn.commit()
+            invalidate_feed_cache()
 
-        # Delete the post from the database
-        cur.execute("DELETE FROM posts WHERE post_id = %s", (post_id,))
-        conn.commit()
+            # Remove image files no other post, reply or user refers to
+            collect_uploads(unreferenced)
 
-        return jsonify({"message": "Post and associated image deleted successfully"}), 200
+            return jsonify({"message": "Post and associated image deleted successfully"}), 200
 
     except Exception as e:
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Get a single post by post_id with replies (optional authentication)
 @app.route('/posts/<int:post_id>', methods=['GET'])
+@replica_read
 @token_optional
 def get_post_with_replies(decoded_token, post_id):
     """
@@ -886,6 +3086,16 @@ def get_post_with_replies(decoded_token, post_id):
         schema:
           type: integer
           example: 123
+      - name: repliesLimit
+        in: query
+        required: false
+        description:
+          Return only the first page of replies, of this size (capped by PLAYGRADE_REPLIES_MAX_PAGE_SIZE), together
+          with repliesNextCursor and repliesHasMore. Later pages come from GET /posts/{post_id}/replies. Without it,
+          every reply is returned; long threads are streamed.
+        schema:
+          type: integer
+          example: 20
     responses:
       200:
         description: Post and replies retrieved successfully.
@@ -909,6 +3119,9 @@ def get_post_with_replies(decoded_token, post_id):
                       type: string
                     image_url:
                       type: string
+                    image_variants:
+                      type: object
+                      description: Resized, metadata-free copies by size and format once post-processing has run, e.g. {"thumb": {"webp": "/uploads/<name>-thumb.webp"}}; null until then.
                     like_count:
                       type: integer
                     reply_count:
@@ -950,6 +3163,14 @@ def get_post_with_replies(decoded_token, post_id):
                       liked:
                         type: boolean
                         description: Whether the authenticated user has liked this reply.
+                repliesNextCursor:
+                  type: string
+                  description: Only with repliesLimit. Pass as `after` to GET /posts/{post_id}/replies; null on the last page.
+                repliesHasMore:
+                  type: boolean
+                  description: Only with repliesLimit. Whether more replies follow the first page.
+      400:
+        description: repliesLimit is not an integer.
       404:
         description: Post not found.
       500:
@@ -958,6 +3179,12 @@ def get_post_with_replies(decoded_token, post_id):
     try:
         user_id = decoded_token['user_id'] if decoded_token else None  # User ID if logged in, otherwise None
 
+        replies_limit = request.args.get('repliesLimit')
+        try:
+            replies_limit = parse_replies_limit(replies_limit) if replies_limit is not None else None
+        except ValueError:
+            return jsonify({"error": "repliesLimit must be an integer"}), 400
+
         # SQL query to fetch the post with user details
         post_query = """
             SELECT 
@@ -967,99 +3194,173 @@ def get_post_with_replies(decoded_token, post_id):
                 posts.category, 
                 posts.body, 
                 posts.image_url, 
+                posts.image_variants,
                 posts.like_count, 
                 posts.reply_count, 
                 posts.created_at,
                 users.username, 
                 users.profile_picture,
-                CASE 
-                    WHEN likes.user_id IS NOT NULL THEN TRUE 
-                    ELSE FALSE 
-                END AS liked
+                users.profile_picture_variants,
+                FALSE AS liked
             FROM posts
             JOIN users ON posts.poster_id = users.user_id
-            LEFT JOIN likes ON posts.post_id = likes.post_id AND likes.user_id = %s
             WHERE posts.post_id = %s
         """
 
-        # SQL query to fetch replies associated with the post
-        replies_query = """
-            SELECT 
-                replies.reply_id, 
-                replies.post_id, 
-                replies.replier_id, 
-                replies.body, 
-                replies.image_url, 
-                replies.like_count, 
-                replies.created_at, 
-                users.username, 
-                users.profile_picture,
-                CASE 
-                    WHEN likes.user_id IS NOT NULL THEN TRUE 
-                    ELSE FALSE 
-                END AS liked
-            FROM replies
-            JOIN users ON replies.replier_id = users.user_id
-            LEFT JOIN likes ON replies.reply_id = likes.reply_id AND likes.user_id = %s
-            WHERE replies.post_id = %s
-            ORDER BY replies.created_at ASC
-        """
+        # Let Postgres render the whole document, liked flags included
+        if PG_JSON_RESPONSES and replies_limit is None:
+            with get_db_connection() as conn, conn.cursor() as cur:
+                execute_prepared(cur, POST_WITH_REPLIES_JSON_QUERY, (user_id, user_id, post_id))
+                row = cur.fetchone()
+            if row is None:
+                return jsonify({"error": "Post not found"}), 404
+            return app.response_class(row[0], mimetype='application/json')
 
         # Execute the queries
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Fetch the post
-        cur.execute(post_query, (user_id, post_id))
-        post = cur.fetchone()
-
-        # Check if the post exists
-        if post is None:
-            return jsonify({"error": "Post not found"}), 404
-
-        # Fetch the replies
-        cur.execute(replies_query, (user_id, post_id))
-        replies = cur.fetchall()
-
-        # Combine the post and replies into a single response
-        response = {
-            "post": post,
-            "replies": replies
-        }
-
-        return jsonify(response), 200
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Fetch the post
+            execute_prepared(cur, post_query, (post_id,))
+            post = cur.fetchone()
+
+            # Check if the post exists
+            if post is None:
+                return jsonify({"error": "Post not found"}), 404
+
+            # Mark whether the viewer has liked the post
+            if user_id:
+                overlay_liked(conn, user_id, [post], "post")
+
+            # Only the first page of replies
+            if replies_limit is not None:
+                replies, next_cursor, has_more = fetch_replies_page(conn, user_id, post_id, None, replies_limit)
+                return jsonify({
+                    "post": post,
+                    "replies": replies,
+                    "repliesNextCursor": next_cursor,
+                    "repliesHasMore": has_more
+                }), 200
+
+            # Short threads are fetched and returned in one go
+            if post['reply_count'] <= REPLIES_CONFIG['server_cursor_threshold']:
+                execute_prepared(cur, REPLIES_QUERY.format(after="", limit=""), (post_id,))
+                replies = cur.fetchall()
+                if user_id:
+                    overlay_liked(conn, user_id, replies, "reply")
+
+                # Combine the post and replies into a single response
+                return jsonify({"post": post, "replies": replies}), 200
+
+        # Long threads are streamed from a server-side cursor
+        return stream_post_with_replies(user_id, post)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
-# Get multiple posts using query parameters and pagination
-@app.route('/posts', methods=['GET'])
+# Get a page of replies to a post
+@app.route('/posts/<int:post_id>/replies', methods=['GET'])
+@replica_read
 @token_optional
-def get_posts(decoded_token):
+def get_post_replies(decoded_token, post_id):
     """
-    Retrieve posts with optional filters, sorting, and pagination
+    Retrieve a page of replies to a post, oldest first.
     ---
     tags:
-      - Posts
+      - Replies
+    description: Returns replies in (created_at, reply_id) order using keyset pagination. Pass the previous
+                 response's nextCursor as `after` to get the following page. If authenticated, each reply
+                 indicates whether the user has liked it.
     parameters:
-      - in: header
-        name: Authorization
+      - name: post_id
+        in: path
+        required: true
+        description: The ID of the post whose replies to retrieve.
+        schema:
+          type: integer
+          example: 123
+      - name: after
+        in: query
         required: false
-        description: Optional Bearer token for authentication.
+        description: Opaque cursor from a previous response's nextCursor (or repliesNextCursor from GET /posts/{post_id}).
         schema:
           type: string
-          example: "Bearer your_token_here"
-      - in: query
-        name: posterId
+      - name: limit
+        in: query
         required: false
-        description: Filter posts by a specific user's ID.
+        description: Number of replies per page (default PLAYGRADE_REPLIES_PAGE_SIZE, capped by PLAYGRADE_REPLIES_MAX_PAGE_SIZE).
         schema:
           type: integer
-          example: 123
+          example: 50
+    responses:
+      200:
+        description: Replies retrieved successfully. nextCursor is null and hasMore is false on the last page.
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                replies:
+                  type: array
+                  items:
+                    type: object
+                nextCursor:
+                  type: string
+                hasMore:
+                  type: boolean
+      400:
+        description: Invalid limit or cursor.
+      404:
+        description: Post not found.
+      500:
+        description: Server error.
+    """
+    try:
+        user_id = decoded_token['user_id'] if decoded_token else None
+
+        try:
+            limit = parse_replies_limit(request.args.get('limit'))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM posts WHERE post_id = %s", (post_id,))
+                if not cur.fetchone():
+                    return jsonify({"error": "Post not found"}), 404
+
+            replies, next_cursor, has_more = fetch_replies_page(conn, user_id, post_id, request.args.get('after'), limit)
+            return jsonify({"replies": replies, "nextCursor": next_cursor, "hasMore": has_more}), 200
+
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Get multiple posts using query parameters and pagination
+@app.route('/posts', methods=['GET'])
+@replica_read
+@token_optional
+def get_posts(decoded_token):
+    """
+    Retrieve posts with optional filters, sorting, and pagination
+    ---
+    tags:
+      - Posts
+    parameters:
+      - in: header
+        name: Authorization
+        required: false
+        description: Optional Bearer token for authentication.
+        schema:
+          type: string
+          example: "Bearer your_token_here"
+      - in: query
+        name: posterId
+        required: false
+        description: Filter posts by a specific user's ID.
+        schema:
+          type: integer
+          example: 123
       - in: query
         name: categories
         required: false
@@ -1081,7 +3382,9 @@ def get_posts(decoded_token):
       - in: query
         name: searchQuery
         required: false
-        description: Search posts by title or body.
+        description:
+          Search posts by title or body. Each word matches as a prefix against the full-text index; use sortBy
+          Relevance to rank results by ts_rank.
         schema:
           type: string
           example: "arcade games"
@@ -1099,7 +3402,7 @@ def get_posts(decoded_token):
         description: Sort posts by a specific criterion.
         schema:
           type: string
-          enum: ["Newest", "Most Liked", "Most Comments"]
+          enum: ["Newest", "Most Liked", "Most Comments", "Relevance"]
           example: "Most Liked"
       - in: query
         name: page
@@ -1115,11 +3418,30 @@ def get_posts(decoded_token):
         schema:
           type: integer
           example: 10
+      - in: query
+        name: cursor
+        required: false
+        description:
+          Opaque cursor taken from a previous response's nextCursor. Returns the page that follows it for the
+          same sortBy, and takes precedence over page.
+        schema:
+          type: string
+      - in: query
+        name: countMode
+        required: false
+        description:
+          How totalPages and totalCount are computed. exact runs a full COUNT, capped stops counting at a cap
+          and reports e.g. "1000+", estimate uses planner statistics for unfiltered feeds (capped otherwise),
+          and none skips counting so clients rely on hasMore.
+        schema:
+          type: string
+          enum: ["exact", "capped", "estimate", "none"]
+          example: "capped"
     responses:
       200:
-        description: Posts retrieved successfully.
+        description: Posts retrieved successfully. nextCursor is null and hasMore is false on the last page.
       400:
-        description: Bad request (e.g., invalid filter values).
+        description: Bad request (e.g., invalid filter values or cursor).
       500:
         description: Server error.
     """
@@ -1129,27 +3451,55 @@ def get_posts(decoded_token):
         limit = int(request.args.get('limit', 10))
         offset = (page - 1) * limit
 
+        # How totalPages is worked out: exact, capped, estimate or none (rely on hasMore)
+        count_mode = request.args.get('countMode', 'exact')
+        if count_mode not in ("exact", "capped", "estimate", "none"):
+            return jsonify({"error": "Invalid countMode. Must be 'exact', 'capped', 'estimate' or 'none'"}), 400
+
+        # Full-text search terms, each matched as a word prefix
+        search_query = request.args.get('searchQuery', '').strip()
+        search_terms = build_search_tsquery(search_query)
+        if search_terms and not search_tsquery_has_terms(search_terms):
+            search_terms = None  # Only stop words: fall back to substring matching below
+        search_rank = "ts_rank(posts.search_vector, search_tsquery)"
+
+        # Sort keys, all descending; post_id breaks ties so every row has a unique position for cursors
         sort_by = request.args.get('sortBy', 'Newest')
         sort_options = {
-            "Newest": "posts.created_at DESC",
-            "Most Liked": "posts.like_count DESC, posts.created_at DESC",
-            "Most Comments": "posts.reply_count DESC, posts.created_at DESC"
+            "Newest": ["posts.created_at", "posts.post_id"],
+            "Most Liked": ["posts.like_count", "posts.created_at", "posts.post_id"],
+            "Most Comments": ["posts.reply_count", "posts.created_at", "posts.post_id"],
+            "Relevance": [search_rank, "posts.post_id"]
         }
-        order_by = sort_options.get(sort_by, "posts.created_at DESC")
-
-        # Base query
-        query = """
-            SELECT posts.post_id, posts.poster_id, posts.title, posts.category, posts.body, posts.image_url,
-                   posts.like_count, posts.reply_count, posts.created_at, users.username, users.profile_picture,
-                   CASE WHEN likes.user_id IS NOT NULL THEN TRUE ELSE FALSE END AS liked
+        if sort_by not in sort_options or (sort_by == "Relevance" and not search_terms):
+            sort_by = "Newest"
+        sort_keys = sort_options[sort_by]
+        order_by = ", ".join(f"{key} DESC" for key in sort_keys)
+
+        # Base query. On the Postgres JSON path only the cursor keys and the rendered post come back.
+        if PG_JSON_RESPONSES:
+            columns = f"posts.post_id, posts.like_count, posts.reply_count, posts.created_at, ({POST_JSON_SQL})::text AS post_json"
+        else:
+            columns = """
+                posts.post_id, posts.poster_id, posts.title, posts.category, posts.body, posts.image_url,
+                posts.image_variants, posts.like_count, posts.reply_count, posts.created_at, users.username,
+                users.profile_picture, users.profile_picture_variants, FALSE AS liked
+            """
+        query = f"""
+            SELECT {columns}
+                   {f", {search_rank} AS search_rank" if search_terms else ""}
             FROM posts
             JOIN users ON posts.poster_id = users.user_id
-            LEFT JOIN likes ON posts.post_id = likes.post_id AND likes.user_id = %s
+            {"CROSS JOIN to_tsquery('english', %s) AS search_tsquery" if search_terms else ""}
             WHERE 1=1
         """
-        count_query = "SELECT COUNT(*) FROM posts WHERE 1=1"
-        params = [user_id if user_id else -1]  # Placeholder for likes check
+        count_base = "SELECT COUNT(*) FROM posts WHERE 1=1"
+        count_query = count_base
+        # The query is viewer-independent and liked flags are overlaid afterwards, except on the Postgres JSON path
+        params = [user_id] if PG_JSON_RESPONSES else []
         count_params = []  # Separate list for count query
+        if search_terms:
+            params.append(search_terms)
 
         # Filter by posterId (User Page)
         poster_id = request.args.get('posterId')
@@ -1182,56 +3532,258 @@ def get_posts(decoded_token):
             query += f" AND {age_filters[age_range]}"
             count_query += f" AND {age_filters[age_range]}"
 
-        # Filter by search query (title OR body)
-        search_query = request.args.get('searchQuery', '').strip()
-        if search_query:
+        # Filter by search query (title OR body), through the GIN-indexed search vector where possible
+        if search_terms:
+            query += " AND posts.search_vector @@ search_tsquery"
+            count_query += " AND posts.search_vector @@ to_tsquery('english', %s)"
+            count_params.append(search_terms)
+        elif search_query:
+            # Punctuation- and stop-word-only searches have no words to index, so keep substring matching for them
             query += " AND (posts.title ILIKE %s OR posts.body ILIKE %s)"
             count_query += " AND (posts.title ILIKE %s OR posts.body ILIKE %s)"
             params.extend([f"%{search_query}%", f"%{search_query}%"])
             count_params.extend([f"%{search_query}%", f"%{search_query}%"])
 
+        # Candidate queries covering consecutive stretches of the sort order; a page one leaves short continues into the next
+        candidates = [(query, params)]
+        timeline_feed = False
+
         # Filter by Followed Users
         users_filter = request.args.get('users', 'All Users')
-        if users_filter == "Followed Users" and user_id:
-            query += """
+        followed_only = users_filter == "Followed Users" and user_id
+        if followed_only:
+            followed_filter = """
                 AND posts.poster_id IN (
                     SELECT followee_id FROM follows WHERE follower_id = %s
                 )
             """
-            count_query += """
-                AND posts.poster_id IN (
-                    SELECT followee_id FROM follows WHERE follower_id = %s
-                )
-            """
-            params.append(user_id)
+            count_query += followed_filter
             count_params.append(user_id)
-
-        # Apply sorting and pagination
-        query += f" ORDER BY {order_by} LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+            candidates = [(query + followed_filter, params + [user_id])]
+
+            # Newest-first pages are read from the materialized timeline plus posts from users too big to fan out,
+            # down to the timeline's oldest entry, and from the follows query only below it (see timeline_candidates)
+            timeline_feed = sort_by == "Newest"
+
+        # Continue after the cursor's row instead of skipping rows with OFFSET
+        cursor = request.args.get('cursor')
+        page_clause, page_params = "", []
+        if cursor:
+            cursor_values = decode_cursor(cursor, sort_by, len(sort_keys))
+            # ts_rank is a real; its cursor value must be compared as one, not as a numeric literal
+            placeholders = ['%s::real' if key == search_rank else '%s' for key in sort_keys]
+            page_clause += f" AND ({', '.join(sort_keys)}) < ({', '.join(placeholders)})"
+            page_params.extend(cursor_values)
+            offset = 0
+
+        # Apply sorting and pagination, fetching one extra row to detect a following page
+        page_clause += f" ORDER BY {order_by} LIMIT %s OFFSET %s"
+        page_params.extend([limit + 1, offset])
+
+        # Pages that do not depend on the viewer are shared through the feed cache
+        cache_key = None
+        if not followed_only and not PG_JSON_RESPONSES:
+            cache_key = (
+                sort_by, poster_id, tuple(sorted(set(stored_categories))), age_range if age_range in age_filters else "All",
+                " ".join(search_query.lower().split()), page, limit, cursor, count_mode
+            )
+            cached = feed_cache.get(cache_key)
+            if cached is not None:
+                response = dict(cached, posts=[dict(post) for post in cached["posts"]])
+                if user_id:
+                    with get_db_connection() as conn:
+                        overlay_liked(conn, user_id, response["posts"], "post")
+                return jsonify(response), 200
 
         # Execute queries
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if timeline_feed:
+                candidates = timeline_candidates(
+                    cur, user_id, query, params, candidates[0], cursor_values if cursor else None
+                )
 
-        # Get posts
-        cur.execute(query, tuple(params))
-        posts = cur.fetchall()
+            # Get posts, continuing into the next candidate while the page is short. In page mode the rows an
+            # empty candidate would have skipped are counted so the next one starts at the right offset.
+            posts = []
+            remaining_offset = offset
+            for index, (candidate_query, candidate_params) in enumerate(candidates):
+                execute_prepared(
+                    cur, candidate_query + page_clause,
+                    tuple(candidate_params + page_params[:-2] + [limit + 1 - len(posts), remaining_offset])
+                )
+                rows = cur.fetchall()
+                posts.extend(rows)
+                if len(posts) > limit or index == len(candidates) - 1:
+                    break
+                if rows:
+                    remaining_offset = 0
+                elif remaining_offset:
+                    execute_prepared(cur, f"SELECT COUNT(*) FROM ({candidate_query}) AS skipped", tuple(candidate_params))
+                    remaining_offset = max(remaining_offset - cur.fetchone()['count'], 0)
+            has_more = len(posts) > limit
+            posts = posts[:limit]
+            next_cursor = None
+            if has_more:
+                last = posts[-1]
+                next_cursor = encode_cursor(sort_by, [
+                    last['search_rank'] if key == search_rank else last[key.split('.')[-1]] for key in sort_keys
+                ])
+            for post in posts:
+                post.pop('search_rank', None)
+            if PG_JSON_RESPONSES:
+                posts = [post['post_json'] for post in posts]
+
+            # Get total count according to the requested mode
+            total_posts, total_pages = None, None
+            if count_mode == "estimate" and count_query == count_base:
+                # Unfiltered feed: use the planner's row estimate instead of scanning the table
+                cur.execute("SELECT reltuples::bigint AS count FROM pg_class WHERE oid = 'posts'::regclass")
+                total_posts = cur.fetchone()["count"]
+                if total_posts < 0:  # Table has never been analyzed
+                    count_mode = "exact"
+            elif count_mode == "estimate":
+                count_mode = "capped"  # Estimates are only reliable without filters
+
+            if count_mode == "exact":
+                execute_prepared(cur, count_query, tuple(count_params))
+                total_posts = cur.fetchone()["count"]
+            elif count_mode == "capped":
+                # Stop counting once the cap is passed
+                execute_prepared(
+                    cur,
+                    f"SELECT COUNT(*) FROM ({count_query.replace('COUNT(*)', '1', 1)} LIMIT %s) AS capped_posts",
+                    tuple(count_params) + (COUNT_CAP + 1,)
+                )
+                total_posts = cur.fetchone()["count"]
+
+            if total_posts is not None:
+                if count_mode == "capped" and total_posts > COUNT_CAP:
+                    total_pages = (COUNT_CAP + limit - 1) // limit
+                    total_posts = f"{COUNT_CAP}+"
+                else:
+                    total_pages = (total_posts + limit - 1) // limit  # Correct page calculation
+
+            response = {
+                "posts": posts,
+                "totalPages": total_pages,
+                "totalCount": total_posts,
+                "currentPage": page,
+                "nextCursor": next_cursor,
+                "hasMore": has_more
+            }
+            if PG_JSON_RESPONSES:
+                return raw_json_response(response, "posts", posts)
+            if cache_key is not None:
+                feed_cache.set(cache_key, dict(response, posts=[dict(post) for post in posts]), ttl=FEED_CACHE_TTLS[sort_by])
+
+            # Mark the posts the viewer has liked
+            if user_id:
+                overlay_liked(conn, user_id, posts, "post")
+
+            return jsonify(response), 200
+
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Get total count
-        cur.execute(count_query, tuple(count_params))
-        total_posts = cur.fetchone()["count"]
-        total_pages = (total_posts + limit - 1) // limit  # Correct page calculation
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"posts": posts, "totalPages": total_pages, "currentPage": page}), 200
+# Suggest post titles while the user types a search
+@app.route('/posts/suggest', methods=['GET'])
+@replica_read
+def suggest_posts():
+    """
+    Suggest post titles matching a partial search query.
+    ---
+    tags:
+      - Posts
+    description:
+        Returns the titles that best match the typed text, using a trigram index on post titles. Results are cached
+        per prefix, and each lookup has a hard time budget; when it is exceeded an empty list is returned with
+        timedOut set to true.
+    parameters:
+      - in: query
+        name: q
+        required: true
+        description: The text typed so far. Fewer than 3 characters returns no suggestions.
+        schema:
+          type: string
+          example: "zeld"
+      - in: query
+        name: limit
+        required: false
+        description: Maximum number of suggestions.
+        schema:
+          type: integer
+          example: 8
+    responses:
+      200:
+        description: Suggestions retrieved successfully.
+        schema:
+          type: object
+          properties:
+            suggestions:
+              type: array
+              items:
+                type: object
+                properties:
+                  post_id:
+                    type: integer
+                  title:
+                    type: string
+            timedOut:
+              type: boolean
+      500:
+        description: Server error.
+    """
+    prefix = " ".join(request.args.get('q', '').lower().split())
+    try:
+        limit = max(1, min(int(request.args.get('limit', SUGGEST_CONFIG['limit'])), SUGGEST_CONFIG['max_limit']))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    if len(prefix) < SUGGEST_CONFIG['min_length']:
+        return jsonify({"suggestions": [], "timedOut": False}), 200
+
+    cached = suggest_cache.get((prefix, limit))
+    if cached is not None:
+        return jsonify({"suggestions": cached[0], "timedOut": False}), 200
+
+    # A complete result list for a shorter prefix already contains every match for this one; it is ranked again
+    # against this prefix, in the same order the query would return
+    for length in range(len(prefix) - 1, SUGGEST_CONFIG['min_length'] - 1, -1):
+        shorter = suggest_cache.get((prefix[:length], limit))
+        if shorter is not None and shorter[1]:
+            suggestions = [s for s in shorter[0] if prefix in s['title'].lower()]
+            suggestions.sort(key=lambda s: (trigram_similarity(s['title'], prefix), s['post_id']), reverse=True)
+            suggest_cache.set((prefix, limit), (suggestions, True))
+            return jsonify({"suggestions": suggestions, "timedOut": False}), 200
+
+    pattern = "%" + prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    try:
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", (SUGGEST_CONFIG['timeout_ms'],))
+            cur.execute(
+                """
+                SELECT post_id, title
+                FROM posts
+                WHERE title ILIKE %s
+                ORDER BY similarity(title, %s) DESC, post_id DESC
+                LIMIT %s
+                """,
+                (pattern, prefix, limit)
+            )
+            suggestions = [dict(row) for row in cur.fetchall()]
+
+        suggest_cache.set((prefix, limit), (suggestions, len(suggestions) < limit))
+        return jsonify({"suggestions": suggestions, "timedOut": False}), 200
+
+    except psycopg2.errors.QueryCanceled:
+        return jsonify({"suggestions": [], "timedOut": True}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Like a post or reply
 @app.route('/likes', methods=['POST'])
 @token_required
@@ -1294,51 +3846,25 @@ def like(decoded_token):
     if not target_id or target_type not in ['post', 'reply']:
         return jsonify({"error": "Invalid input"}), 400
 
-    column = 'post_id' if target_type == 'post' else 'reply_id'
-    table = 'posts' if target_type == 'post' else 'replies'
-
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Check if target exists
-        cur.execute(f"SELECT 1 FROM {table} WHERE {column} = %s", (target_id,))
-        if not cur.fetchone():
-            return jsonify({"error": f"{target_type.capitalize()} not found"}), 404
-
-        # Check if like already exists
-        cur.execute(
-            f"""
-            SELECT 1 FROM likes 
-            WHERE user_id = %s 
-            AND {column} = %s
-            """, 
-            (user_id, target_id)
-        )
-        if cur.fetchone():
-            return jsonify({"error": "Like already exists"}), 400
-
-        # Add like
-        cur.execute(
-            f"""
-            INSERT INTO likes (user_id, {column}) 
-            VALUES (%s, %s)
-            """,
-            (user_id, target_id)
-        )
-
-        # Increment like_count for posts or replies
-        cur.execute(f"UPDATE {table} SET like_count = like_count + 1 WHERE {column} = %s", (target_id,))
-
-        conn.commit()
-        return jsonify({"message": "Like added successfully"}), 201
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if like_queue.enabled:
+                body, status = queue_like_change(cur, user_id, target_type, target_id, True)
+                return jsonify(body), status
+
+            # Add the like and increment like_count in one statement
+            body, status = apply_like_change(cur, user_id, target_type, target_id, True)
+            if status != 201:
+                return jsonify(body), status
+
+            conn.commit()
+            record_like(user_id, target_type, target_id, True)
+            if target_type == 'post':
+                invalidate_feed_posts([int(target_id)], "Most Liked")
+            return jsonify(body), status
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-
-    finally:
-        cur.close()
-        conn.close()
         
 # Unlike a post or reply
 @app.route('/likes', methods=['DELETE'])
@@ -1402,47 +3928,252 @@ def unlike(decoded_token):
     if not target_id or target_type not in ['post', 'reply']:
         return jsonify({"error": "Invalid input"}), 400
 
-    column = 'post_id' if target_type == 'post' else 'reply_id'
-    table = 'posts' if target_type == 'post' else 'replies'
-
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if like_queue.enabled:
+                body, status = queue_like_change(cur, user_id, target_type, target_id, False)
+                return jsonify(body), status
+
+            # Remove the like and decrement like_count in one statement
+            body, status = apply_like_change(cur, user_id, target_type, target_id, False)
+            if status != 200:
+                return jsonify(body), status
+
+            conn.commit()
+            record_like(user_id, target_type, target_id, False)
+            if target_type == 'post':
+                invalidate_feed_posts([int(target_id)], "Most Liked")
+            return jsonify(body), status
 
-        # Check if like exists
-        cur.execute(
-            f"""
-            SELECT 1 FROM likes 
-            WHERE user_id = %s 
-            AND {column} = %s
-            """,
-            (user_id, target_id)
-        )
-        if not cur.fetchone():
-            return jsonify({"error": "Like does not exist"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Remove like
-        cur.execute(
-            f"""
-            DELETE FROM likes 
-            WHERE user_id = %s 
-            AND {column} = %s
-            """,
-            (user_id, target_id)
-        )
+# Like and unlike several posts or replies at once
+@app.route('/likes/batch', methods=['POST'])
+@token_required
+def like_batch(decoded_token):
+    """
+    Like or unlike several posts or replies in one request (Requires Authorization).
+    ---
+    tags:
+      - Likes
+    description: |
+      Applies a list of like/unlike operations in order, in a single transaction, and reports a result per item.
+      Each result carries the status code and message or error the single-item `POST /likes` or `DELETE /likes`
+      would have returned. Items that fail (for example a duplicate like) do not affect the others; a target_id
+      that is not a positive JSON integer is reported as invalid input.
+      At most PLAYGRADE_LIKE_BATCH_LIMIT (default 100) items are accepted per request.
+    parameters:
+      - in: header
+        name: Authorization
+        required: true
+        description: Bearer token for authentication.
+        schema:
+          type: string
+          example: "Bearer your_token_here"
+      - in: body
+        name: body
+        required: true
+        description: List of like operations.
+        schema:
+          type: array
+          items:
+            type: object
+            required:
+              - target_id
+              - type
+              - op
+            properties:
+              target_id:
+                type: integer
+                example: 123
+              type:
+                type: string
+                enum: ["post", "reply"]
+                example: "post"
+              op:
+                type: string
+                enum: ["like", "unlike"]
+                example: "like"
+    responses:
+      200:
+        description: Operations applied; see the per-item results.
+        schema:
+          type: object
+          properties:
+            results:
+              type: array
+              items:
+                type: object
+                properties:
+                  target_id:
+                    type: integer
+                    example: 123
+                  type:
+                    type: string
+                    example: "post"
+                  op:
+                    type: string
+                    example: "like"
+                  status:
+                    type: integer
+                    example: 201
+                  message:
+                    type: string
+                    example: "Like added successfully"
+                  error:
+                    type: string
+                    example: "Like already exists"
+      400:
+        description: The body is not a list, is empty or has too many items.
+      401:
+        description: Authorization token is missing or invalid.
+      500:
+        description: Server error.
+    security:
+      - Bearer: []
+    """
+    user_id = decoded_token['user_id']
+    items = request.json
 
-        # Decrement like_count for posts or replies
-        cur.execute(f"UPDATE {table} SET like_count = GREATEST(like_count - 1, 0) WHERE {column} = %s", (target_id,))
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty list of like operations is required"}), 400
+    if len(items) > LIKE_BATCH_LIMIT:
+        return jsonify({"error": f"At most {LIKE_BATCH_LIMIT} operations are allowed per batch"}), 400
 
-        conn.commit()
-        return jsonify({"message": "Like removed successfully"}), 200
+    try:
+        results = []
+        applied = []
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            for item in items:
+                item = item if isinstance(item, dict) else {}
+                target_id = item.get('target_id')
+                target_type = item.get('type')
+                op = item.get('op')
+
+                # Anything Postgres would reject as an ID is refused here, since an error would abort the whole batch
+                valid_id = isinstance(target_id, int) and not isinstance(target_id, bool) and 0 < target_id <= MAX_SERIAL_ID
+                if not valid_id or target_type not in ['post', 'reply'] or op not in ['like', 'unlike']:
+                    body, status = {"error": "Invalid input"}, 400
+                elif like_queue.enabled:
+                    body, status = queue_like_change(cur, user_id, target_type, target_id, op == 'like')
+                else:
+                    body, status = apply_like_change(cur, user_id, target_type, target_id, op == 'like')
+                    if status < 400:
+                        applied.append((target_type, target_id, op == 'like'))
+
+                results.append({"target_id": target_id, "type": target_type, "op": op, "status": status, **body})
+
+            conn.commit()
+
+        for target_type, target_id, liked in applied:
+            record_like(user_id, target_type, target_id, liked)
+        invalidate_feed_posts([target_id for target_type, target_id, _ in applied if target_type == 'post'], "Most Liked")
+
+        return jsonify({"results": results}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
+# Liked flags for a set of posts and replies
+@app.route('/likes/state', methods=['GET'])
+@replica_read
+@token_required
+def get_like_state(decoded_token):
+    """
+    Retrieve the viewer's liked flags for several posts and replies (Requires Authorization).
+    ---
+    tags:
+      - Likes
+    description: |
+      Returns, for each requested post and reply ID, whether the logged-in user has liked it. IDs are passed as
+      comma-separated lists; at most PLAYGRADE_LIKE_BATCH_LIMIT (default 100) IDs are accepted per list.
+    parameters:
+      - in: header
+        name: Authorization
+        required: true
+        description: Bearer token for authentication.
+        schema:
+          type: string
+          example: "Bearer your_token_here"
+      - name: posts
+        in: query
+        type: string
+        required: false
+        description: Comma-separated post IDs.
+        example: "12,15,31"
+      - name: replies
+        in: query
+        type: string
+        required: false
+        description: Comma-separated reply IDs.
+        example: "4,9"
+    responses:
+      200:
+        description: Liked flags keyed by ID.
+        schema:
+          type: object
+          properties:
+            posts:
+              type: object
+              additionalProperties:
+                type: boolean
+              example: {"12": true, "15": false, "31": false}
+            replies:
+              type: object
+              additionalProperties:
+                type: boolean
+              example: {"4": false, "9": true}
+      400:
+        description: IDs are not integers or a list is too long.
+      401:
+        description: Authorization token is missing or invalid.
+      500:
+        description: Server error.
+    security:
+      - Bearer: []
+    """
+    user_id = decoded_token['user_id']
+
+    try:
+        post_ids = [int(value) for value in request.args.get('posts', '').split(',') if value.strip()]
+        reply_ids = [int(value) for value in request.args.get('replies', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({"error": "posts and replies must be comma-separated integers"}), 400
+
+    if len(post_ids) > LIKE_BATCH_LIMIT or len(reply_ids) > LIKE_BATCH_LIMIT:
+        return jsonify({"error": f"At most {LIKE_BATCH_LIMIT} IDs are allowed per list"}), 400
+
+    try:
+        liked_posts, liked_replies = set(), set()
+        if post_ids or reply_ids:
+            with get_db_connection() as conn, conn.cursor() as cur:
+                # Both halves are served by the unique (user_id, post_id) and (user_id, reply_id) indexes
+                cur.execute(
+                    "SELECT post_id, reply_id FROM likes WHERE user_id = %s AND (post_id = ANY(%s) OR reply_id = ANY(%s))",
+                    (user_id, post_ids, reply_ids)
+                )
+                for post_id, reply_id in cur.fetchall():
+                    if post_id is not None:
+                        liked_posts.add(post_id)
+                    if reply_id is not None:
+                        liked_replies.add(reply_id)
+
+        posts = {str(post_id): post_id in liked_posts for post_id in post_ids}
+        replies = {str(reply_id): reply_id in liked_replies for reply_id in reply_ids}
+
+        # Changes still waiting in the like queue override what Postgres has
+        if like_queue.enabled:
+            for target_type, flags in (('post', posts), ('reply', replies)):
+                for target_id in flags:
+                    pending = like_queue.pending_state(user_id, target_type, int(target_id))
+                    if pending is not None:
+                        flags[target_id] = pending
+
+        return jsonify({"posts": posts, "replies": replies}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 # Follow a user account
 @app.route('/follows', methods=['POST'])
@@ -1495,37 +4226,43 @@ def follow(decoded_token):
         return jsonify({"error": "You cannot follow yourself"}), 400
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Check if the followee exists
-        cur.execute("SELECT user_id FROM users WHERE user_id = %s", (followee_id,))
-        if not cur.fetchone():
-            return jsonify({"error": "User to follow not found"}), 404
-
-        # Check if the user is already following
-        cur.execute(
-            "SELECT 1 FROM follows WHERE follower_id = %s AND followee_id = %s",
-            (follower_id, followee_id)
-        )
-        if cur.fetchone():
-            return jsonify({"error": "You are already following this user"}), 400
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Create the follow relationship and bump follower_count in one statement
+            cur.execute(
+                """
+                WITH followee AS (
+                    SELECT user_id FROM users WHERE user_id = %s
+                ),
+                added AS (
+                    INSERT INTO follows (follower_id, followee_id)
+                    SELECT %s, user_id FROM followee
+                    ON CONFLICT DO NOTHING
+                    RETURNING followee_id
+                ),
+                counted AS (
+                    UPDATE users SET follower_count = follower_count + 1
+                    WHERE user_id IN (SELECT followee_id FROM added)
+                )
+                SELECT
+                    EXISTS (SELECT 1 FROM followee) AS found,
+                    EXISTS (SELECT 1 FROM added) AS added
+                """,
+                (followee_id, follower_id)
+            )
+            result = cur.fetchone()
+            if not result['found']:
+                return jsonify({"error": "User to follow not found"}), 404
+            if not result['added']:
+                return jsonify({"error": "You are already following this user"}), 400
 
-        # Create the follow relationship
-        cur.execute(
-            "INSERT INTO follows (follower_id, followee_id) VALUES (%s, %s)",
-            (follower_id, followee_id)
-        )
-        conn.commit()
-        return jsonify({"message": "Follow created successfully"}), 201
+            # Bring the followee's recent posts into the follower's home timeline
+            backfill_timeline(cur, follower_id, followee_id)
+            conn.commit()
+            return jsonify({"message": "Follow created successfully"}), 201
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Unfollow a user account
 @app.route('/follows', methods=['DELETE'])
 @token_required
@@ -1573,32 +4310,45 @@ def unfollow(decoded_token):
         return jsonify({"error": "Followee ID is required"}), 400
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Delete the follow relationship, decrement follower_count and drop the
+            # unfollowed user's posts from the follower's home timeline in one statement
+            cur.execute(
+                """
+                WITH removed AS (
+                    DELETE FROM follows
+                    WHERE follower_id = %s AND followee_id = %s
+                    RETURNING follower_id, followee_id
+                ),
+                counted AS (
+                    UPDATE users SET follower_count = GREATEST(follower_count - 1, 0)
+                    WHERE user_id IN (SELECT followee_id FROM removed)
+                    RETURNING follower_count
+                ),
+                unfanned AS (
+                    DELETE FROM timeline
+                    USING removed
+                    WHERE timeline.user_id = removed.follower_id
+                    AND timeline.poster_id = removed.followee_id
+                )
+                SELECT EXISTS (SELECT 1 FROM removed) AS removed, (SELECT follower_count FROM counted) AS follower_count
+                """,
+                (follower_id, followee_id)
+            )
+            result = cur.fetchone()
+            if not result['removed']:
+                return jsonify({"error": "You are not following this user"}), 400
 
-        # Check if the follow relationship exists
-        cur.execute(
-            "SELECT 1 FROM follows WHERE follower_id = %s AND followee_id = %s",
-            (follower_id, followee_id)
-        )
-        if not cur.fetchone():
-            return jsonify({"error": "You are not following this user"}), 400
+            # Back under the fan-out limit: the posts made above it go into the remaining followers' timelines
+            if result['follower_count'] == TIMELINE_CONFIG['fanout_limit']:
+                backfill_timeline(cur, None, followee_id)
 
-        # Delete the follow relationship
-        cur.execute(
-            "DELETE FROM follows WHERE follower_id = %s AND followee_id = %s",
-            (follower_id, followee_id)
-        )
-        conn.commit()
-        return jsonify({"message": "Unfollowed successfully"}), 200
+            conn.commit()
+            return jsonify({"message": "Unfollowed successfully"}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Create reply to post
 @app.route('/replies', methods=['POST'])
 @token_required
@@ -1672,54 +4422,48 @@ def create_reply(decoded_token):
     if len(body) > 300:
         return jsonify({"error": "Reply body must not exceed 300 characters"}), 400
 
+    # Validate the optional image before taking a connection; it is only moved into place once the reply is inserted
+    upload = stage_upload(image) if image else None
+    image_url = upload.url if upload else None
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Check if the post exists
-        cur.execute("SELECT 1 FROM posts WHERE post_id = %s", (post_id,))
-        if not cur.fetchone():
-            return jsonify({"error": "Post not found"}), 404
-
-        # Handle the image file (optional)
-        image_url = None
-        if image:
-            # Save the file and get its path (customize this)
-            image_url = f"/uploads/{image.filename}"
-            image.save(f"./uploads/{image.filename}")
-
-        # Insert the reply
-        cur.execute(
-            """
-            INSERT INTO replies (post_id, replier_id, body, image_url)
-            VALUES (%s, %s, %s, %s)
-            RETURNING reply_id
-            """,
-            (post_id, user_id, body, image_url)
-        )
-        reply_id = cur.fetchone()['reply_id']
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Insert the reply and increment the post's reply count in one statement;
+            # no row comes back when the post does not exist
+            cur.execute(
+                """
+                WITH added AS (
+                    INSERT INTO replies (post_id, replier_id, body, image_url)
+                    SELECT post_id, %s, %s, %s FROM posts WHERE post_id = %s
+                    RETURNING reply_id, post_id
+                ),
+                counted AS (
+                    UPDATE posts
+                    SET reply_count = reply_count + 1
+                    WHERE post_id IN (SELECT post_id FROM added)
+                )
+                SELECT reply_id, post_id FROM added
+                """,
+                (user_id, body, image_url, post_id)
+            )
+            reply = cur.fetchone()
+            if not reply:
+                return jsonify({"error": "Post not found"}), 404
+            reply_id = reply['reply_id']
 
-        # Increment the reply count for the related post
-        cur.execute(
-            """
-            UPDATE posts
-            SET reply_count = reply_count + 1
-            WHERE post_id = %s
-            """,
-            (post_id,)
-        )
+            # Reference the image (optional) and move its file into place
+            if upload:
+                acquire_upload(cur, upload)
+                upload.commit()
 
-        conn.commit()
+            conn.commit()
+            invalidate_feed_posts([reply['post_id']], "Most Comments")
 
-        return jsonify({"message": "Reply created successfully", "reply_id": reply_id}), 201
+            return jsonify({"message": "Reply created successfully", "reply_id": reply_id}), 201
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
-
 # Delete reply to post
 @app.route('/replies/<int:reply_id>', methods=['DELETE'])
 @token_required
@@ -1754,52 +4498,233 @@ def delete_reply(decoded_token, reply_id):
     is_admin = decoded_token['is_admin']
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Check if the reply exists
-        cur.execute("SELECT post_id, replier_id, image_url FROM replies WHERE reply_id = %s", (reply_id,))
-        reply = cur.fetchone()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Delete the reply if the caller owns it (or is an admin) and decrement the
+            # post's reply count in one statement; the target row says why nothing was deleted
+            cur.execute(
+                """
+                WITH target AS (
+                    SELECT reply_id, post_id, replier_id, image_url
+                    FROM replies
+                    WHERE reply_id = %s
+                    FOR UPDATE
+                ),
+                removed AS (
+                    DELETE FROM replies
+                    WHERE reply_id IN (SELECT reply_id FROM target WHERE replier_id = %s OR %s)
+                    RETURNING post_id
+                ),
+                counted AS (
+                    UPDATE posts
+                    SET reply_count = reply_count - 1
+                    WHERE post_id IN (SELECT post_id FROM removed) AND reply_count > 0
+                )
+                SELECT post_id, image_url, EXISTS (SELECT 1 FROM removed) AS removed
+                FROM target
+                """,
+                (reply_id, user_id, bool(is_admin))
+            )
+            reply = cur.fetchone()
 
-        if not reply:
-            return jsonify({"error": "Reply not found"}), 404
+            if not reply:
+                return jsonify({"error": "Reply not found"}), 404
 
-        post_id = reply['post_id']
+            # Check permissions
+            if not reply['removed']:
+                return jsonify({"error": "Unauthorized action"}), 403
 
-        # Check permissions
-        if reply['replier_id'] != user_id and not is_admin:
-            return jsonify({"error": "Unauthorized action"}), 403
+            unreferenced = release_uploads(cur, [reply.get('image_url')])
+            conn.commit()
 
-        # Delete the image file if it exists
-        image_url = reply.get('image_url')
-        if image_url:
-            absolute_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(image_url))
-            if os.path.exists(absolute_path):
-                os.remove(absolute_path)
+            # Delete the image file if nothing else refers to it, now that the reply is gone
+            collect_uploads(unreferenced)
+            invalidate_feed_posts([reply['post_id']], "Most Comments")
 
-        # Delete the reply
-        cur.execute("DELETE FROM replies WHERE reply_id = %s", (reply_id,))
+            return jsonify({"message": "Reply and associated image deleted successfully"}), 200
 
-        # Decrement the reply count for the related post
-        cur.execute(
-            """
-            UPDATE posts
-            SET reply_count = reply_count - 1
-            WHERE post_id = %s AND reply_count > 0
-            """,
-            (post_id,)
-        )
-
-        conn.commit()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"message": "Reply and associated image deleted successfully"}), 200
+# In-process cache statistics for this worker
+@app.route('/stats/caches', methods=['GET'])
+def get_cache_stats():
+    """
+    Retrieve in-process cache statistics for the serving worker.
+    ---
+    tags:
+      - Stats
+    description:
+        Returns entry counts and hit/miss counters for this worker's caches. The liked-set cache also reports its
+        approximate memory use against its byte budget.
+    responses:
+      200:
+        description: Cache statistics retrieved successfully.
+    """
+    return jsonify({
+        "feed": feed_cache.stats(),
+        "liked": liked_cache.stats(),
+        "resize": resize_cache.stats(),
+        "suggest": suggest_cache.stats(),
+        "tokens": token_cache.stats()
+    }), 200
+
+# Connection pool statistics for this worker
+@app.route('/stats/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    """
+    Retrieve database connection pool statistics for the serving worker.
+    ---
+    tags:
+      - Stats
+    description:
+        Returns the current state of this worker process's database connection pool, including connections in use,
+        requests waiting for a connection and checkout latency. Each gunicorn worker has its own pool. When a read
+        replica is configured, its pool is reported under replica.
+    responses:
+      200:
+        description: Pool statistics retrieved successfully.
+        schema:
+          type: object
+          properties:
+            in_use:
+              type: integer
+              example: 3
+            idle:
+              type: integer
+              example: 2
+            waiting:
+              type: integer
+              example: 0
+            checkout_latency_ms:
+              type: object
+              properties:
+                avg:
+                  type: number
+                  example: 0.042
+                max:
+                  type: number
+                  example: 12.5
+    """
+    return jsonify(dict(
+        db_pool.stats(),
+        prepared_statements=prepared_statement_counters,
+        replica=replica_pool.stats() if replica_pool is not None else None
+    )), 200
+
+# Like queue statistics for this worker
+@app.route('/stats/like-queue', methods=['GET'])
+def get_like_queue_stats():
+    """
+    Retrieve group-commit like queue statistics for the serving worker.
+    ---
+    tags:
+      - Stats
+    description:
+        Returns the number of likes/unlikes waiting in the local journal, totals for this worker's flusher and
+        per-batch metrics (entries read, changes after collapsing, rows added/removed, lag and duration) for the most
+        recent flushes. The queue is only used when PLAYGRADE_LIKE_QUEUE_PATH is set.
+    responses:
+      200:
+        description: Queue statistics retrieved successfully.
+    """
+    return jsonify(like_queue.stats()), 200
 
+# Upload store deduplication statistics
+@app.route('/stats/uploads', methods=['GET'])
+def get_upload_stats():
+    """
+    Retrieve upload store deduplication statistics.
+    ---
+    tags:
+      - Stats
+    description:
+        Uploads are stored once under their content hash and shared by every post, reply and profile picture with
+        the same content. Returns the stored files and the references to them, the dedup ratio (references per
+        file) and bytes saved (bytes referenced minus bytes stored; files uploaded before the store existed have no
+        recorded size), plus this worker's counts of uploads written and uploads that matched a stored file.
+    responses:
+      200:
+        description: Upload statistics retrieved successfully.
+        schema:
+          type: object
+          properties:
+            files:
+              type: integer
+              example: 1200
+            references:
+              type: integer
+              example: 1500
+            dedup_ratio:
+              type: number
+              example: 1.25
+            stored_bytes:
+              type: integer
+              example: 524288000
+            bytes_saved:
+              type: integer
+              example: 131072000
+      500:
+        description: Server error.
+    """
+    try:
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT
+                    COUNT(*) AS files,
+                    COALESCE(SUM(ref_count), 0) AS reference_count,
+                    COALESCE(SUM(size_bytes), 0)::bigint AS stored_bytes,
+                    COALESCE(SUM(size_bytes * (ref_count - 1)), 0)::bigint AS bytes_saved
+                FROM upload_refs
+                WHERE ref_count > 0
+                """
+            )
+            store = cur.fetchone()
+        return jsonify({
+            "files": store['files'],
+            "references": store['reference_count'],
+            "dedup_ratio": round(store['reference_count'] / store['files'], 3) if store['files'] else None,
+            "stored_bytes": store['stored_bytes'],
+            "bytes_saved": store['bytes_saved'],
+            "worker": upload_store_counters
+        }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cur.close()
-        conn.close()
+# Image post-processing statistics
+@app.route('/stats/image-jobs', methods=['GET'])
+def get_image_job_stats():
+    """
+    Retrieve image post-processing job statistics.
+    ---
+    tags:
+      - Stats
+    description:
+        Returns the number of queued image jobs (not yet tried, running or waiting on a retry backoff, and given up
+        after the last attempt, with the most recent error) plus this worker's completed/retried/failed totals and the variant
+        formats its Pillow build can write.
+    responses:
+      200:
+        description: Job statistics retrieved successfully.
+      500:
+        description: Server error.
+    """
+    try:
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT
+                    COUNT(*) FILTER (WHERE failed_at IS NULL AND attempts = 0) AS queued,
+                    COUNT(*) FILTER (WHERE failed_at IS NULL AND attempts > 0) AS attempted,
+                    COUNT(*) FILTER (WHERE failed_at IS NOT NULL) AS failed,
+                    (SELECT last_error FROM image_jobs WHERE last_error IS NOT NULL ORDER BY run_at DESC LIMIT 1) AS last_error
+                FROM image_jobs
+                """
+            )
+            queue = cur.fetchone()
+        return jsonify(dict(image_job_worker.stats(), queue=queue)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
     app.run(debug=True)
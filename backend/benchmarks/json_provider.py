@@ -0,0 +1,63 @@
+# Compare the stdlib and orjson Flask JSON providers on get_posts-shaped responses.
+#
+# Usage: python benchmarks/json_provider.py [repeat]
+#
+# Needs no database: pages of RealDictRow posts (with datetime created_at) are generated in memory and
+# rendered through each provider's response(), which is what jsonify calls.
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, OrjsonProvider, orjson
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extras import RealDictRow
+
+def make_page(size):
+    now = datetime(2025, 1, 1, 12, 0, 0)
+    posts = [
+        RealDictRow({
+            "post_id": 100000 - i,
+            "poster_id": 1000 + i % 97,
+            "title": f"Post title number {i} about a game",
+            "category": "G",
+            "body": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 5,
+            "image_url": f"/uploads/{i:08x}.png",
+            "like_count": i * 7 % 1000,
+            "reply_count": i * 3 % 200,
+            "created_at": now - timedelta(minutes=i),
+            "username": f"player_{1000 + i % 97}",
+            "profile_picture": f"/uploads/avatar_{i % 97}.png",
+            "liked": i % 5 == 0
+        })
+        for i in range(size)
+    ]
+    return {
+        "posts": posts,
+        "totalPages": 100,
+        "totalCount": 1000,
+        "currentPage": 1,
+        "nextCursor": "eyJzIjoiTmV3ZXN0IiwiayI6W119",
+        "hasMore": True
+    }
+
+def main():
+    if orjson is None:
+        sys.exit("orjson is not installed")
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    providers = {"stdlib": DefaultJSONProvider(app), "orjson": OrjsonProvider(app)}
+
+    with app.app_context():
+        for size in (10, 50, 200):
+            page = make_page(size)
+            results = {}
+            for name, provider in providers.items():
+                seconds = min(timeit.repeat(lambda: provider.response(page), number=repeat, repeat=5)) / repeat
+                results[name] = seconds
+                print(f"{size:>4} posts  {name:<7} {seconds * 1e6:9.1f} us/response")
+            print(f"{size:>4} posts  speedup {results['stdlib'] / results['orjson']:6.1f}x")
+
+if __name__ == "__main__":
+    main()
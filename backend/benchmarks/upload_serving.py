@@ -0,0 +1,128 @@
+# Compare GET /uploads/<file> before and after immutable caching headers, under gunicorn.
+#
+# Usage: python benchmarks/upload_serving.py [seconds] [concurrency] [views]
+#
+# Needs gunicorn but no database. A random 256 KiB image is written to the uploads folder and fetched through
+# the previous handler (plain send_from_directory, no-cache) and the current one, as full downloads and as
+# If-None-Match revalidations. Browsers revalidate no-cache files on every view, while immutable files are not
+# requested again until max-age runs out; the views line models a client seeing the image VIEWS times. The current path
+# also runs once more with gunicorn's sendfile turned off, to show what zero-copy saves on full downloads.
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ['PLAYGRADE_IMAGE_WORKER'] = '0'  # The gunicorn workers started below have no database for image jobs
+
+from app import app
+from flask import send_from_directory
+
+# The handler as it was before caching headers were added
+@app.route('/benchmarks/legacy-uploads/<path:filename>', methods=['GET'])
+def legacy_serve_uploaded_file(filename):
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=False)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(port, *options):
+    server = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', '--chdir', BACKEND_DIR, '-b', f'127.0.0.1:{port}',
+            '-w', '2', '-k', 'gthread', '--threads', '4', '--log-level', 'warning', *options,
+            'benchmarks.upload_serving:app'
+        ]
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    sys.exit("gunicorn did not start")
+
+# Issue requests from `concurrency` keep-alive connections for `seconds`; returns (requests/s, MB/s)
+def run(port, path, headers, expect, seconds, concurrency):
+    counts = [0] * concurrency
+    received = [0] * concurrency
+    stop = time.time() + seconds
+
+    def client(i):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        while time.time() < stop:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            if response.status != expect:
+                raise RuntimeError(f"{path}: expected {expect}, got {response.status}")
+            counts[i] += 1
+            received[i] += len(body)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    return sum(counts) / elapsed, sum(received) / elapsed / 1e6
+
+def head(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', path)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.getheader('ETag'), response.getheader('Cache-Control')
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    views = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    filename = f"{uuid.uuid4().hex}.jpg"
+    path = os.path.join(BACKEND_DIR, app.config['UPLOAD_FOLDER'], filename)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(256 * 1024))
+
+    paths = {"legacy": f"/benchmarks/legacy-uploads/{filename}", "current": f"/uploads/{filename}"}
+    servers = []
+    try:
+        port = free_port()
+        servers.append(start_server(port))
+        for name, url in paths.items():
+            etag, cache_control = head(port, url)
+            print(f"{name:<8} Cache-Control: {cache_control}  ETag: {etag}")
+            full = run(port, url, {}, 200, seconds, concurrency)
+            revalidate = run(port, url, {'If-None-Match': etag}, 304, seconds, concurrency)
+            print(f"{name:<8} full download  {full[0]:9.0f} req/s {full[1]:9.1f} MB/s")
+            print(f"{name:<8} revalidation   {revalidate[0]:9.0f} req/s")
+
+            # Server time spent on one client's views: one download, then a revalidation per view unless immutable
+            repeats = views - 1 if cache_control == 'no-cache' else 0
+            per_client = 1 / full[0] + repeats / revalidate[0]
+            print(f"{name:<8} {views} views     {views / per_client:9.0f} views/s ({1 + repeats} requests per client)")
+
+        no_sendfile_port = free_port()
+        servers.append(start_server(no_sendfile_port, '--no-sendfile'))
+        full = run(no_sendfile_port, paths["current"], {}, 200, seconds, concurrency)
+        print(f"current  full download  {full[0]:9.0f} req/s {full[1]:9.1f} MB/s  (sendfile off)")
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Compare the old check-then-act like/unlike statements with the single-statement CTE versions.
+#
+# Usage: python benchmarks/write_path.py [iterations]
+#
+# Runs against the database in PLAYGRADE_DB_CONFIG. A scratch user and post are created for the
+# run and deleted afterwards. Round trips count every statement plus the BEGIN psycopg2 sends
+# before the first one and the final COMMIT.
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import PLAYGRADE_DB_CONFIG
+import psycopg2
+
+LEGACY_LIKE = [
+    ("SELECT 1 FROM posts WHERE post_id = %(post_id)s", True),
+    ("SELECT 1 FROM likes WHERE user_id = %(user_id)s AND post_id = %(post_id)s", True),
+    ("INSERT INTO likes (user_id, post_id) VALUES (%(user_id)s, %(post_id)s)", False),
+    ("UPDATE posts SET like_count = like_count + 1 WHERE post_id = %(post_id)s", False),
+]
+
+LEGACY_UNLIKE = [
+    ("SELECT 1 FROM likes WHERE user_id = %(user_id)s AND post_id = %(post_id)s", True),
+    ("DELETE FROM likes WHERE user_id = %(user_id)s AND post_id = %(post_id)s", False),
+    ("UPDATE posts SET like_count = GREATEST(like_count - 1, 0) WHERE post_id = %(post_id)s", False),
+]
+
+CTE_LIKE = [(
+    """
+    WITH target AS (SELECT post_id FROM posts WHERE post_id = %(post_id)s),
+    added AS (
+        INSERT INTO likes (user_id, post_id) SELECT %(user_id)s, post_id FROM target
+        ON CONFLICT DO NOTHING RETURNING post_id
+    ),
+    counted AS (UPDATE posts SET like_count = like_count + 1 WHERE post_id IN (SELECT post_id FROM added))
+    SELECT EXISTS (SELECT 1 FROM target) AS found, EXISTS (SELECT 1 FROM added) AS added
+    """,
+    True,
+)]
+
+CTE_UNLIKE = [(
+    """
+    WITH removed AS (
+        DELETE FROM likes WHERE user_id = %(user_id)s AND post_id = %(post_id)s RETURNING post_id
+    ),
+    counted AS (
+        UPDATE posts SET like_count = GREATEST(like_count - 1, 0) WHERE post_id IN (SELECT post_id FROM removed)
+    )
+    SELECT EXISTS (SELECT 1 FROM removed) AS removed
+    """,
+    True,
+)]
+
+# Run one request's statements in a transaction and return (round trips, seconds)
+def run_transaction(conn, statements, params):
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        for sql, fetch in statements:
+            cur.execute(sql, params)
+            if fetch:
+                cur.fetchone()
+    conn.commit()
+    return len(statements) + 2, time.perf_counter() - start
+
+def report(name, samples):
+    timings = sorted(seconds for _, seconds in samples)
+    round_trips = samples[0][0]
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    print(f"{name:<14} round trips {round_trips:>2}   p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    conn = psycopg2.connect(**PLAYGRADE_DB_CONFIG)
+    marker = uuid.uuid4().hex[:12]
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING user_id",
+                (f"bench_{marker}", f"bench_{marker}@example.invalid", "!")
+            )
+            user_id = cur.fetchone()[0]
+            cur.execute(
+                "INSERT INTO posts (poster_id, title, body, category) VALUES (%s, %s, %s, %s) RETURNING post_id",
+                (user_id, "benchmark", "benchmark", "G")
+            )
+            post_id = cur.fetchone()[0]
+        conn.commit()
+
+        params = {'user_id': user_id, 'post_id': post_id}
+        for name, like, unlike in (("legacy", LEGACY_LIKE, LEGACY_UNLIKE), ("single CTE", CTE_LIKE, CTE_UNLIKE)):
+            like_samples, unlike_samples = [], []
+            for _ in range(iterations):
+                like_samples.append(run_transaction(conn, like, params))
+                unlike_samples.append(run_transaction(conn, unlike, params))
+            report(f"{name} like", like_samples)
+            report(f"{name} unlike", unlike_samples)
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE username = %s", (f"bench_{marker}",))
+        conn.commit()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
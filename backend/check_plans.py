@@ -0,0 +1,215 @@
+# Fail when a read handler's query plan falls back to a sequential scan.
+#
+# Usage: python check_plans.py [--seed]
+#
+# Drives the read endpoints through the Flask test client, records every query they run on a pooled
+# connection, whatever the cursor class, and runs EXPLAIN on each. Exits non-zero if any plan contains a
+# Seq Scan, or if the PLAYGRADE_PG_JSON rendering of a checked page differs from the jsonify one.
+# --seed applies migrations and loads a synthetic dataset first; point PLAYGRADE_DB_* at a scratch
+# database when using it, because the seed data is inserted for real.
+import app as app_module
+from app import app, PooledConnection, PLAYGRADE_DB_CONFIG, PREPARED_STATEMENT_CONFIG
+from migrate import migrate
+import psycopg2
+import json
+import time
+import sys
+import jwt
+
+# Synthetic data large enough that the planner prefers indexes wherever the queries allow them
+SEED_SQL = """
+    SELECT setseed(0.42);
+
+    INSERT INTO users (username, email, password_hash)
+    SELECT 'seed_user_' || n, 'seed_user_' || n || '@example.invalid', '!'
+    FROM generate_series(1, 2000) AS n;
+
+    INSERT INTO posts (poster_id, title, category, body, like_count, reply_count, created_at)
+    SELECT
+        (SELECT MIN(user_id) FROM users) + (n % 2000),
+        'Seed post ' || n || ' about ' || (ARRAY['racing', 'puzzle', 'horror', 'jazz', 'drama'])[1 + n % 5],
+        (ARRAY['G', 'F', 'M'])[1 + n % 3],
+        'Seeded body text for post ' || n,
+        (random() * 500)::int,
+        (random() * 50)::int,
+        (NOW() AT TIME ZONE 'UTC') - (random() * INTERVAL '730 days')
+    FROM generate_series(1, 40000) AS n;
+
+    INSERT INTO replies (post_id, replier_id, body, created_at)
+    SELECT
+        (SELECT MIN(post_id) FROM posts) + (n % 40000),
+        (SELECT MIN(user_id) FROM users) + (n * 7 % 2000),
+        'Seeded reply ' || n,
+        (NOW() AT TIME ZONE 'UTC') - (random() * INTERVAL '730 days')
+    FROM generate_series(1, 80000) AS n;
+
+    INSERT INTO follows (follower_id, followee_id)
+    SELECT DISTINCT follower_id, followee_id
+    FROM (
+        SELECT
+            (SELECT MIN(user_id) FROM users) + (n % 2000) AS follower_id,
+            (SELECT MIN(user_id) FROM users) + ((n * 31 + 7) % 2000) AS followee_id
+        FROM generate_series(1, 20000) AS n
+    ) AS pairs
+    WHERE follower_id <> followee_id
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO likes (user_id, post_id)
+    SELECT DISTINCT
+        (SELECT MIN(user_id) FROM users) + (n % 2000),
+        (SELECT MIN(post_id) FROM posts) + ((n * 13) % 40000)
+    FROM generate_series(1, 100000) AS n
+    ON CONFLICT DO NOTHING;
+
+    UPDATE users
+    SET follower_count = counts.follower_count
+    FROM (SELECT followee_id, COUNT(*) AS follower_count FROM follows GROUP BY followee_id) AS counts
+    WHERE users.user_id = counts.followee_id;
+
+    INSERT INTO timeline (user_id, post_id, poster_id, created_at)
+    SELECT follows.follower_id, posts.post_id, posts.poster_id, posts.created_at
+    FROM follows
+    JOIN posts ON posts.poster_id = follows.followee_id
+    ON CONFLICT DO NOTHING;
+"""
+
+# Read endpoints and the variations of each whose queries should stay on indexes
+def checked_requests(user_id, post_id, reply_id):
+    return [
+        f"/users/{user_id}",
+        f"/posts/{post_id}",
+        f"/posts/{post_id}?repliesLimit=20",
+        f"/posts/{post_id}/replies?limit=20",
+        "/posts?sortBy=Newest&countMode=none",
+        "/posts?sortBy=Most%20Liked&countMode=none",
+        "/posts?sortBy=Most%20Comments&countMode=none",
+        "/posts?sortBy=Newest&categories=%F0%9F%8E%AE%20Games&countMode=capped",
+        f"/posts?sortBy=Newest&posterId={user_id}&countMode=exact",
+        "/posts?sortBy=Relevance&searchQuery=racing&countMode=capped",
+        "/posts?sortBy=Newest&users=Followed%20Users&countMode=none",
+        "/posts?sortBy=Most%20Liked&users=Followed%20Users&countMode=none",
+        "/posts/suggest?q=racing",
+        f"/likes/state?posts={post_id}&replies={reply_id}",
+    ]
+
+# Pages the Postgres JSON path renders, compared against jsonify output
+def pg_json_requests(post_id):
+    return [
+        f"/posts/{post_id}",
+        "/posts?sortBy=Newest&countMode=none",
+        "/posts?sortBy=Relevance&searchQuery=racing&countMode=capped",
+    ]
+
+def seed():
+    migrate()
+    conn = psycopg2.connect(**PLAYGRADE_DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SEED_SQL)
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE")
+    finally:
+        conn.close()
+
+# Every Seq Scan node in an EXPLAIN (FORMAT JSON) plan, as relation names
+def seq_scans(plan):
+    found = [plan.get("Relation Name", "?")] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+def main():
+    if "--seed" in sys.argv:
+        seed()
+
+    # No background workers while driving the handlers from here
+    app.testing = True
+
+    # Record the plain SQL the handlers send. psycopg2's base cursor cannot be patched, so pooled connections
+    # hand out a recording subclass of whichever cursor class was asked for.
+    PREPARED_STATEMENT_CONFIG['enabled'] = False
+    recorded = []
+    recording_classes = {}
+    original_cursor = PooledConnection.cursor
+
+    def recording_class(cursor_class):
+        if cursor_class not in recording_classes:
+            def execute(self, query, vars=None):
+                recorded.append((query, vars))
+                return cursor_class.execute(self, query, vars)
+            recording_classes[cursor_class] = type(f"Recording{cursor_class.__name__}", (cursor_class,), {"execute": execute})
+        return recording_classes[cursor_class]
+
+    def recording_cursor(self, *args, cursor_factory=None, **kwargs):
+        cursor_class = cursor_factory or self.cursor_factory or psycopg2.extensions.cursor
+        return original_cursor(self, *args, cursor_factory=recording_class(cursor_class), **kwargs)
+
+    PooledConnection.cursor = recording_cursor
+
+    conn = psycopg2.connect(**PLAYGRADE_DB_CONFIG)
+    failures = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT follower_id FROM follows ORDER BY follower_id LIMIT 1")
+            user_id = cur.fetchone()[0]
+            cur.execute("SELECT post_id FROM posts ORDER BY reply_count DESC LIMIT 1")
+            post_id = cur.fetchone()[0]
+            cur.execute("SELECT reply_id FROM replies WHERE post_id = %s LIMIT 1", (post_id,))
+            reply_id = cur.fetchone()[0]
+        conn.rollback()
+
+        token = jwt.encode({"user_id": user_id, "is_admin": False, "iat": int(time.time())}, app.config['SECRET_KEY'], algorithm="HS256")
+        client = app.test_client()
+
+        for path in checked_requests(user_id, post_id, reply_id):
+            del recorded[:]
+            response = client.get(path, headers={"Authorization": f"Bearer {token}"})
+            if response.status_code != 200:
+                print(f"FAIL {path}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+                failures += 1
+                continue
+
+            for query, params in recorded:
+                # Only reads can be explained; SET LOCAL and the like are skipped
+                if query.split(None, 1)[0].upper() not in ("SELECT", "WITH"):
+                    continue
+                with conn.cursor() as cur:
+                    cur.execute("EXPLAIN (FORMAT JSON) " + cur.mogrify(query, params).decode('utf-8'))
+                    plan = cur.fetchone()[0]
+                conn.rollback()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = seq_scans(plan[0]["Plan"])
+                status = "FAIL" if scans else "ok  "
+                if scans:
+                    failures += 1
+                summary = " ".join(query.split())[:100]
+                print(f"{status} {path}: {summary}" + (f"  [Seq Scan on {', '.join(scans)}]" if scans else ""))
+
+        # The same pages rendered by Postgres must parse to the same documents
+        for path in pg_json_requests(post_id):
+            documents = []
+            for pg_json in (False, True):
+                app_module.PG_JSON_RESPONSES = pg_json
+                app_module.feed_cache.clear()
+                response = client.get(path, headers={"Authorization": f"Bearer {token}"})
+                documents.append((response.status_code, response.get_json()))
+            app_module.PG_JSON_RESPONSES = False
+            if documents[0] != documents[1]:
+                print(f"FAIL {path}: PLAYGRADE_PG_JSON response differs (HTTP {documents[1][0]})")
+                failures += 1
+            else:
+                print(f"ok   {path}: PLAYGRADE_PG_JSON response matches")
+    finally:
+        PooledConnection.cursor = original_cursor
+        conn.close()
+
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+    print("All query plans use indexes")
+
+if __name__ == "__main__":
+    main()
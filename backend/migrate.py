@@ -0,0 +1,51 @@
+from app import PLAYGRADE_DB_CONFIG
+import psycopg2
+import os
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Arbitrary key for the advisory lock that stops two deploys migrating at once
+MIGRATION_LOCK_KEY = 7351
+
+# Apply every migration in MIGRATIONS_DIR that has not been recorded in schema_migrations, in filename order
+def migrate():
+    conn = psycopg2.connect(**PLAYGRADE_DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version TEXT PRIMARY KEY,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+            """)
+            conn.commit()
+
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cur.fetchall()}
+
+            for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+                version, extension = os.path.splitext(filename)
+                if extension != '.sql' or version in applied:
+                    continue
+
+                with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as f:
+                    sql = f.read()
+
+                # Each migration runs in its own transaction together with its bookkeeping row
+                try:
+                    cur.execute(sql)
+                    cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                print(f"Applied {version}")
+
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,52 @@
+-- Base tables queried by app.py. Everything is IF NOT EXISTS so databases created before migrations
+-- existed pick up this version without changes; later migrations add the derived columns and tables.
+CREATE TABLE IF NOT EXISTS users (
+    user_id SERIAL PRIMARY KEY,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    profile_picture TEXT,
+    is_admin BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+-- created_at columns are UTC timestamps without a time zone, which is how jsonify renders them
+CREATE TABLE IF NOT EXISTS posts (
+    post_id SERIAL PRIMARY KEY,
+    poster_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    title VARCHAR(255) NOT NULL,
+    category CHAR(1) NOT NULL CHECK (category IN ('G', 'F', 'M')),
+    body VARCHAR(300) NOT NULL,
+    image_url TEXT,
+    like_count INTEGER NOT NULL DEFAULT 0,
+    reply_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+CREATE TABLE IF NOT EXISTS replies (
+    reply_id SERIAL PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES posts(post_id) ON DELETE CASCADE,
+    replier_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    body VARCHAR(300) NOT NULL,
+    image_url TEXT,
+    like_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+-- A like targets exactly one post or one reply
+CREATE TABLE IF NOT EXISTS likes (
+    like_id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    post_id INTEGER REFERENCES posts(post_id) ON DELETE CASCADE,
+    reply_id INTEGER REFERENCES replies(reply_id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    CHECK ((post_id IS NULL) <> (reply_id IS NULL))
+);
+
+CREATE TABLE IF NOT EXISTS follows (
+    follow_id SERIAL PRIMARY KEY,
+    follower_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    followee_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    CHECK (follower_id <> followee_id)
+);
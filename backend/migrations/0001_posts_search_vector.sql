@@ -0,0 +1,8 @@
+-- Full-text search over post titles and bodies, used by the searchQuery filter in GET /posts
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS posts_search_vector_idx ON posts USING GIN (search_vector);
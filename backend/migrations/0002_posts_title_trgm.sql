@@ -0,0 +1,4 @@
+-- Trigram index on post titles, used by GET /posts/suggest
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS posts_title_trgm_idx ON posts USING GIN (title gin_trgm_ops);
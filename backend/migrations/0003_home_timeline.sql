@@ -0,0 +1,35 @@
+-- Follower counts decide whether a user's new posts are fanned out to followers on write
+ALTER TABLE users ADD COLUMN IF NOT EXISTS follower_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE users
+SET follower_count = counts.follower_count
+FROM (SELECT followee_id, COUNT(*) AS follower_count FROM follows GROUP BY followee_id) AS counts
+WHERE users.user_id = counts.followee_id;
+
+-- Materialized "Followed Users" feed: the newest posts from each user's followees
+CREATE TABLE IF NOT EXISTS timeline (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    post_id INTEGER NOT NULL REFERENCES posts(post_id) ON DELETE CASCADE,
+    poster_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, post_id)
+);
+
+CREATE INDEX IF NOT EXISTS timeline_user_created_idx ON timeline (user_id, created_at DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS timeline_post_idx ON timeline (post_id);
+
+-- Backfill the newest 500 posts (PLAYGRADE_TIMELINE_LENGTH's default) per user
+INSERT INTO timeline (user_id, post_id, poster_id, created_at)
+SELECT user_id, post_id, poster_id, created_at
+FROM (
+    SELECT
+        follows.follower_id AS user_id,
+        posts.post_id,
+        posts.poster_id,
+        posts.created_at,
+        ROW_NUMBER() OVER (PARTITION BY follows.follower_id ORDER BY posts.created_at DESC, posts.post_id DESC) AS position
+    FROM follows
+    JOIN posts ON posts.poster_id = follows.followee_id
+) AS ranked
+WHERE position <= 500
+ON CONFLICT DO NOTHING;
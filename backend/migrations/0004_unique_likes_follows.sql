@@ -0,0 +1,25 @@
+-- Unique keys that let likes and follows be written with INSERT ... ON CONFLICT DO NOTHING
+
+-- Drop duplicates left behind by the old check-then-insert race before adding the constraints
+DELETE FROM likes a USING likes b
+WHERE a.ctid > b.ctid AND a.user_id = b.user_id AND a.post_id = b.post_id;
+
+DELETE FROM likes a USING likes b
+WHERE a.ctid > b.ctid AND a.user_id = b.user_id AND a.reply_id = b.reply_id;
+
+DELETE FROM follows a USING follows b
+WHERE a.ctid > b.ctid AND a.follower_id = b.follower_id AND a.followee_id = b.followee_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS likes_user_post_key ON likes (user_id, post_id);
+CREATE UNIQUE INDEX IF NOT EXISTS likes_user_reply_key ON likes (user_id, reply_id);
+CREATE UNIQUE INDEX IF NOT EXISTS follows_follower_followee_key ON follows (follower_id, followee_id);
+
+-- Counters may have drifted under the same race; recompute them from the rows
+UPDATE posts
+SET like_count = (SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.post_id);
+
+UPDATE replies
+SET like_count = (SELECT COUNT(*) FROM likes WHERE likes.reply_id = replies.reply_id);
+
+UPDATE users
+SET follower_count = (SELECT COUNT(*) FROM follows WHERE follows.followee_id = users.user_id);
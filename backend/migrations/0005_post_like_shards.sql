@@ -0,0 +1,8 @@
+-- Sharded like-count deltas: likers add to one of N rows per post instead of all locking the posts row.
+-- A background aggregator folds the deltas into posts.like_count every PLAYGRADE_LIKE_FOLD_INTERVAL seconds.
+CREATE TABLE IF NOT EXISTS post_like_shards (
+    post_id INTEGER NOT NULL REFERENCES posts(post_id) ON DELETE CASCADE,
+    shard SMALLINT NOT NULL,
+    delta INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (post_id, shard)
+);
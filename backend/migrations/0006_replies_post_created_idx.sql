@@ -0,0 +1,2 @@
+-- Keyset pagination of a post's replies in (created_at, reply_id) order
+CREATE INDEX IF NOT EXISTS replies_post_created_idx ON replies (post_id, created_at, reply_id);
@@ -0,0 +1,16 @@
+-- Indexes behind the feed orderings and filters of GET /posts, each ending in the (created_at, post_id)
+-- tie-breakers the keyset cursors compare on
+CREATE INDEX IF NOT EXISTS posts_created_idx ON posts (created_at DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS posts_poster_created_idx ON posts (poster_id, created_at DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS posts_category_created_idx ON posts (category, created_at DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS posts_like_count_idx ON posts (like_count DESC, created_at DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS posts_reply_count_idx ON posts (reply_count DESC, created_at DESC, post_id DESC);
+
+-- likes (user_id, post_id), likes (user_id, reply_id) and follows (follower_id, followee_id) are the unique
+-- indexes from 0004, and replies (post_id, created_at, reply_id) comes from 0006.
+
+-- Reverse lookups: cascading deletes of posts/replies, and a poster's followers when fanning out new posts
+CREATE INDEX IF NOT EXISTS likes_post_idx ON likes (post_id) WHERE post_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS likes_reply_idx ON likes (reply_id) WHERE reply_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS follows_followee_idx ON follows (followee_id);
+CREATE INDEX IF NOT EXISTS replies_replier_idx ON replies (replier_id);
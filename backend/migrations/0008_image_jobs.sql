@@ -0,0 +1,20 @@
+-- Post-processing jobs for uploaded images, claimed by workers with FOR UPDATE SKIP LOCKED.
+-- target_type/target_id name the row whose image_url (post) or profile_picture (user) the job was queued for.
+CREATE TABLE IF NOT EXISTS image_jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    target_type VARCHAR(10) NOT NULL CHECK (target_type IN ('post', 'user')),
+    target_id INTEGER NOT NULL,
+    image_url TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    last_error TEXT,
+    failed_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+-- Runnable jobs in due order; jobs that used up their attempts stay behind for inspection
+CREATE INDEX IF NOT EXISTS image_jobs_run_at_idx ON image_jobs (run_at) WHERE failed_at IS NULL;
+
+-- Generated variant URLs by size and format, e.g. {"feed": {"webp": "/uploads/<name>-feed.webp"}}
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS image_variants JSONB;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_picture_variants JSONB;
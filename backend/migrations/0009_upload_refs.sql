@@ -0,0 +1,22 @@
+-- Uploads are stored once under their content hash; each posts.image_url, replies.image_url and
+-- users.profile_picture pointing at a file holds one reference. Rows are kept at zero references until the file
+-- is removed, so a concurrent upload of the same content waits on the row lock instead of racing the removal.
+CREATE TABLE IF NOT EXISTS upload_refs (
+    image_url TEXT PRIMARY KEY,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    size_bytes BIGINT,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+-- Count references to files uploaded before this table existed; their sizes are not known here
+INSERT INTO upload_refs (image_url, ref_count)
+SELECT image_url, COUNT(*)
+FROM (
+    SELECT image_url FROM posts WHERE image_url IS NOT NULL
+    UNION ALL
+    SELECT image_url FROM replies WHERE image_url IS NOT NULL
+    UNION ALL
+    SELECT profile_picture FROM users WHERE profile_picture IS NOT NULL
+) refs
+GROUP BY image_url
+ON CONFLICT (image_url) DO NOTHING;
@@ -0,0 +1,2 @@
+-- Bumped to revoke a user's tokens (password change); tokens carry the version they were issued under
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;